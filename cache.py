@@ -0,0 +1,155 @@
+# Gateway wide cache. Entries are stored in system.util.getGlobals() so they are
+# shared by every perspective session and survive project script reloads. Only
+# plain python values should be cached (never project class instances) since
+# class definitions are replaced when the project scripts are reloaded.
+import time
+import threading
+from collections import OrderedDict
+
+GLOBALS_KEY = 'PRT_Cache'
+TTL_DEFAULT = 300
+# Seconds between sweeps of a store's expired entries, keys that are never read
+# again (ie of ended sessions) would be kept otherwise.
+PURGE_INTERVAL = 60
+
+
+def _getStore(name):
+	# Retrieve (or create) the named store from the gateway globals.
+	globals_ = system.util.getGlobals()
+	stores = globals_.setdefault(GLOBALS_KEY, {})
+	if name not in stores:
+		stores.setdefault(name, {'entries': OrderedDict(), 'lock': threading.RLock(),
+								 'hits': 0, 'misses': 0})
+	store = stores[name]
+	# Stores created before entries were ordered.
+	if not isinstance(store['entries'], OrderedDict):
+		with store['lock']:
+			store['entries'] = OrderedDict(store['entries'])
+	return store
+
+
+class Cache(object):
+	""" Gateway cache object. """
+
+	def __init__(self, name, ttl=TTL_DEFAULT, maxSize=None):
+		# Name of the store in the gateway globals
+		self.name = name
+		# Seconds before an entry expires (None or 0 never expires)
+		self.ttl = ttl
+		# Number of entries kept, the least recently used go first (None is 
+		# unbounded)
+		self.maxSize = maxSize
+		self._store = _getStore(name)
+
+	@property
+	def Keys(self):
+		with self._lock:
+			return list(self._entries.keys())
+			
+	@property
+	def Stats(self):
+		# Hit/miss counts of get() since the store was created (or reset).
+		with self._lock:
+			hits = self._store.get('hits', 0)
+			misses = self._store.get('misses', 0)
+			return {'size': len(self._entries),
+					'hits': hits,
+					'misses': misses,
+					'hitRate': float(hits)/(hits + misses) if hits + misses else None}
+					
+	def resetStats(self):
+		with self._lock:
+			self._store['hits'] = 0
+			self._store['misses'] = 0
+
+	@property
+	def _entries(self):
+		return self._store['entries']
+
+	@property
+	def _lock(self):
+		return self._store['lock']
+
+	def get(self, key, default=None):
+		# Return the cached value for key or default if missing or expired.
+		with self._lock:
+			entry = self._entries.get(key)
+			if entry is not None and entry[1] and entry[1] < time.time():
+				del self._entries[key]
+				entry = None
+			if entry is None:
+				self._store['misses'] = self._store.get('misses', 0) + 1
+				return default
+			self._store['hits'] = self._store.get('hits', 0) + 1
+			if self.maxSize:
+				# Most recently used entries are kept at the end.
+				self._entries[key] = self._entries.pop(key)
+			return entry[0]
+
+	def has(self, key):
+		# Sentinel so cached None values still register as present
+		missing = object()
+		return self.get(key, missing) is not missing
+
+	def set(self, key, value, tags=None, ttl=None):
+		# Store value under key. Tags (ie table names) allow a group of entries
+		# to be invalidated together with invalidateTag().
+		ttl = self.ttl if ttl is None else ttl
+		now = time.time()
+		expires = now + ttl if ttl else None
+		with self._lock:
+			if now - self._store.get('purgedAt', 0) >= PURGE_INTERVAL:
+				self._purge(now)
+			self._entries.pop(key, None)
+			self._entries[key] = (value, expires, set(tags) if tags else set())
+			while self.maxSize and len(self._entries) > self.maxSize:
+				self._entries.popitem(last=False)
+		return value
+
+	def setDefault(self, key, value, tags=None, ttl=None):
+		# Atomically return the cached value for key, storing value first if
+		# there isn't one (like dict.setdefault).
+		with self._lock:
+			entry = self._entries.get(key)
+			if entry is not None and not (entry[1] and entry[1] < time.time()):
+				return entry[0]
+			return self.set(key, value, tags, ttl)
+
+	def increment(self, key, amount=1):
+		# Atomically add amount to a counter (missing counters start at 0) 
+		# and return the new value, ie generation counters bumped by writes.
+		with self._lock:
+			entry = self._entries.get(key)
+			value = (entry[0] if entry is not None else 0) + amount
+			self._entries[key] = (value, None, entry[2] if entry is not None else set())
+			return value
+
+	def _purge(self, now):
+		# Remove the expired entries, the lock is held by the caller.
+		for key in [key for key, entry in self._entries.items() if entry[1] and entry[1] < now]:
+			del self._entries[key]
+		self._store['purgedAt'] = now
+
+	def invalidate(self, key):
+		with self._lock:
+			self._entries.pop(key, None)
+
+	def invalidateValue(self, key, value):
+		# Remove key only while it still holds value (the same object), ie 
+		# not once it was replaced by another caller.
+		with self._lock:
+			entry = self._entries.get(key)
+			if entry is not None and entry[0] is value:
+				del self._entries[key]
+
+	def invalidateTag(self, tag):
+		# Remove every entry tagged with tag, returns number of entries removed.
+		with self._lock:
+			keys = [key for key, entry in self._entries.items() if tag in entry[2]]
+			for key in keys:
+				del self._entries[key]
+			return len(keys)
+
+	def clear(self):
+		with self._lock:
+			self._entries.clear()
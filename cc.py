@@ -2,6 +2,9 @@
 from qc import Query
 from math import ceil
 from copy import deepcopy
+from ast import literal_eval
+import time
+import re
 
 
 class PowerTable(object):
@@ -13,6 +16,25 @@ class PowerTable(object):
 	DB_TABLE_NAME = 'PowerTable.ViewConfig'
 	ADMIN_DB = 'PRT_ADMIN'
 	DEFAULT_AUTO_ID = 1000
+	# Views whose base query returns this many rows or fewer are loaded once into
+	# the gateway cache and sorted, filtered and paged in memory. Keyed by the base
+	# query so only the IN_MEMORY_CACHE_SIZE most recently used are kept.
+	IN_MEMORY_CACHE = 'PowerTable.InMemory'
+	IN_MEMORY_ROW_THRESHOLD = 500
+	IN_MEMORY_TTL = 300
+	IN_MEMORY_CACHE_SIZE = 100
+	# Rows/cells materialised either side of the viewport by the window methods
+	ROW_WINDOW_BUFFER = 10
+	CELL_WINDOW_BUFFER = 5
+	# Column layouts shared by every row (and table) with the same columns
+	LAYOUT_CACHE = 'PowerTable.ColumnLayout'
+	LAYOUT_CACHE_SIZE = 200
+	# Parsed view configs, checked against a hash of the stored configs
+	VIEW_CONFIG_CACHE = 'PowerTable.ViewConfig'
+	VIEW_CONFIG_VERSION = "CONVERT(VARCHAR(64), HASHBYTES('SHA2_256', configs), 2)"
+	# Base table column metadata for the add column picker
+	COLUMN_METADATA_CACHE = 'PowerTable.ColumnMetadata'
+	COLUMN_METADATA_TTL = 600
 
 	def __init__(self, dataBase, viewConfig=None, configs=None):
 		# Database attribute that can be either Database() object or string. Should be populated
@@ -25,6 +47,11 @@ class PowerTable(object):
 						else PTConfigs(self._getConfigsFromViewConfig(), dataBase=self.dataBase.Name))
 		# Whether or not to paginate the PowerTable results
 		self.paginate = True
+		# Whether or not small results may be served from the gateway cache
+		self.inMemory = True
+		# Whether or not header/row/cell payloads reference columns by index into
+		# getColumnDescriptors() rather than repeating the column configs
+		self.compactPayload = False
 	
 	@property
 	def Query(self):
@@ -38,16 +65,75 @@ class PowerTable(object):
 	@property
 	def Data(self):
 		# Error handling?
+		memory = self._getInMemoryData()
+		if memory is not None:
+			return self._getInMemoryPage(memory)
 		return self.Query.execute(dataBase=self.dataBase.Name)
 		
+	def getData(self, sessionID, componentID, timeout=None):
+		# Data for a session's filter/sort change, cancelling the previous 
+		# query of the same table if it's still running. componentID tells the
+		# table apart from others in the session, ie its view and component path.
+		memory = self._getInMemoryData()
+		if memory is not None:
+			return self._getInMemoryPage(memory)
+		latest = qc.LatestWins(sessionID, 'PowerTable.{0}'.format(componentID))
+		return latest.execute(self.Query, dataBase=self.dataBase.Name, timeout=timeout)
+		
 	def _getConfigsFromViewConfig(self):
-		# View configs are stored as strings in db, converted to a dictionary here.
-		q = Query().Select(['configs']).From(self.DB_TABLE_NAME).Where(['viewConfig = ?'])
+		from val import Error
+		# View configs are stored as JSON strings in db. The parsed configs are 
+		# cached by viewConfig with a hash of the stored string as the version, 
+		# so only the version is queried while the configs are unchanged.
+		key = (self.ADMIN_DB, str(self.viewConfig))
+		configCache = cache.Cache(self.VIEW_CONFIG_CACHE, None)
+		entry = configCache.get(key)
+		q = (Query().Select(['{0} AS [Version]'.format(self.VIEW_CONFIG_VERSION)])
+					.From(self.DB_TABLE_NAME)
+					.Where(['viewConfig = ?']))
 		data = q.execute([str(self.viewConfig)], dataBase=self.ADMIN_DB)
-		if data.getRowCount():
-			return eval(data[0]['configs'])
 		# If no data, return a copy of the template
-		return deepcopy(PTConfigs.CONFIGS_TEMPLATE)
+		if isinstance(data, Error) or not data.getRowCount():
+			return deepcopy(PTConfigs.CONFIGS_TEMPLATE)
+		if entry is None or entry['version'] != data[0]['Version']:
+			q = (Query().Select(['configs', '{0} AS [Version]'.format(self.VIEW_CONFIG_VERSION)])
+						.From(self.DB_TABLE_NAME)
+						.Where(['viewConfig = ?']))
+			data = q.execute([str(self.viewConfig)], dataBase=self.ADMIN_DB)
+			if isinstance(data, Error) or not data.getRowCount():
+				return deepcopy(PTConfigs.CONFIGS_TEMPLATE)
+			entry = configCache.set(key, {'version': data[0]['Version'],
+										  'configs': self._parseConfigs(data[0]['configs'])})
+		# Configs are modified in place by PTConfigs so never hand out the cached dict.
+		return deepcopy(entry['configs'])
+		
+	def _parseConfigs(self, configs):
+		# Configs saved before the JSON format are python literals, literal_eval
+		# reads those without executing anything.
+		try:
+			return system.util.jsonDecode(configs)
+		except:
+			return literal_eval(configs)
+			
+	def _encodeConfigs(self, values):
+		# Store the configs column as JSON.
+		if 'configs' in values and not isinstance(values['configs'], basestring):
+			values = dict(values)
+			values['configs'] = system.util.jsonEncode(values['configs'])
+		return values
+		
+	def invalidateViewConfig(self, viewConfig=None):
+		# Drop the cached parsed configs for a viewConfig (defaults to this one).
+		viewConfig = viewConfig if viewConfig else self.viewConfig
+		cache.Cache(self.VIEW_CONFIG_CACHE, None).invalidate((self.ADMIN_DB, str(viewConfig)))
+		
+	def invalidateTreeBrowser(self):
+		# Call after the write. Registration is by databaseAutoID while the 
+		# trees are cached by database name so every cached tree is dropped,
+		# and the generation bumped so builds started before the write
+		# aren't cached.
+		cache.Cache(PTTreeBrowser.TREE_GENERATION_CACHE, None).increment('generation')
+		cache.Cache(PTTreeBrowser.TREE_CACHE, None).clear()
 		
 	def _decidePagination(self, query):
 		if self.paginate:
@@ -57,10 +143,18 @@ class PowerTable(object):
 		
 	def getQuery(self):
 		# Constructs the query to be executed to populate Data.
+		q = self.getBaseQuery()
+		# Need to add conditionals for filters
+		clauses = self._getWhereClauses()
+		return q.Where(clauses) if clauses else q
+		
+	def getBaseQuery(self, top=None):
+		# Constructs the unfiltered query (columns, tables and joins) that the
+		# filters and pagination are applied to.
 		q = Query()
 		c = self._configs
 		# Using the columns in configs as well as their AutoID columns
-		q.Select(c.getColumnsWithAutoIDs())
+		q.Select(c.getColumnsWithAutoIDs(), top=top)
 		q.From(c.BaseTableObj.FullName, c.BaseTable['alias'] if c.BaseTable['alias'] else c.BaseTableObj.Alias)
 		# Need table to join on from config (default is From table)...
 		for table in c.configs['tables']:
@@ -71,16 +165,125 @@ class PowerTable(object):
 					   c.BaseTable['alias'] if c.BaseTable['alias'] else c.BaseTableObj.Alias,
 					   table['columnJoin'],
 					   table['joinType'])
-		# Need to add conditionals for filters
-		clauses = self._getWhereClauses()
-		return q.Where(clauses) if clauses else q		
+		return q
 	
 	def _getWhereClauses(self):
 		c = self._configs
 		return ["{0} LIKE '%{1}%'".format(name, filter_) for name, filter_ in c.Filters.items()]
+		
+	def _getInMemoryData(self):
+		from val import Error
+		# Returns the cached base query result {'headers': [...], 'rows': [[...]]}
+		# when it has no more than IN_MEMORY_ROW_THRESHOLD rows, otherwise None.
+		if not self.inMemory or self._getInMemoryFilters() is None:
+			return None
+		q = (self.getBaseQuery(top=self.IN_MEMORY_ROW_THRESHOLD + 1)
+				 .OrderBy(self._configs.DefaultOrderBy))
+		key = (self.dataBase.Name, q.Query)
+		memoryCache = cache.Cache(self.IN_MEMORY_CACHE, self.IN_MEMORY_TTL, self.IN_MEMORY_CACHE_SIZE)
+		if memoryCache.has(key):
+			return memoryCache.get(key)
+		data = q.execute(dataBase=self.dataBase.Name)
+		# Expecting PyDataset but catches Error type, SQL handles the request.
+		if isinstance(data, Error):
+			return None
+		memory = None
+		if data.getRowCount() <= self.IN_MEMORY_ROW_THRESHOLD:
+			memory = {'headers': list(data.getColumnNames()),
+					  'rows': [list(row) for row in data]}
+		# Large results are cached as None so the threshold isn't probed again
+		# until the entry expires.
+		tags = [(self.dataBase.Name, db.Table(table['name']).FullName) 
+				for table in self._configs.Tables]
+		return memoryCache.set(key, memory, tags)
+		
+	def _getInMemoryFilters(self):
+		# Returns [(dataIndex, filter), ...] for the filtered columns, or None if
+		# a filter can't be evaluated in memory (FK filters match the referenced 
+		# table's primary ID and dates are matched against SQL's string format).
+		filters = []
+		for i, col in enumerate(self.configs['columns']):
+			if col['filter_']:
+				if col['dataType'] in ['FK', enums.DataType.DATETIME.value]:
+					return None
+				# Each column is followed by its AutoID column in the data
+				filters.append((2*i, self._getLikeRegex(u'%{0}%'.format(col['filter_']))))
+		return filters
+		
+	def _getLikeRegex(self, pattern):
+		# Compile a LIKE pattern (%, _, [abc], [a-z], [^abc]) to an equivalent
+		# case insensitive regex so both paths filter alike.
+		regex = []
+		i = 0
+		while i < len(pattern):
+			char = pattern[i]
+			end = pattern.find(']', i + 1) if char == '[' else -1
+			if char == '%':
+				regex.append('.*')
+			elif char == '_':
+				regex.append('.')
+			elif end != -1:
+				content = pattern[i + 1:end]
+				negate = content.startswith('^')
+				content = content[1:] if negate else content
+				regex.append('[{0}{1}]'.format('^' if negate else '', 
+											   ''.join(c if c == '-' else re.escape(c) for c in content)))
+				i = end
+			else:
+				regex.append(re.escape(char))
+			i += 1
+		return re.compile(u''.join(regex) + r'\Z', re.IGNORECASE | re.UNICODE | re.DOTALL)
+		
+	def _getInMemoryRows(self, memory):
+		# Filter and sort the cached rows the same way the SQL query would.
+		filters = self._getInMemoryFilters()
+		rows = [row for row in memory['rows']
+				if all(self._isLikeMatch(row[index], filter_) for index, filter_ in filters)]
+		orderBy = [(2*i, col['orderBy'] == enums.OrderBy.DESC.value)
+				   for i, col in enumerate(self.configs['columns']) if col['orderBy']]
+		# Stable sorts applied from the last clause to the first.
+		for index, desc in reversed(orderBy):
+			rows.sort(key=lambda row: self._getSortKey(row[index]), reverse=desc)
+		return rows
+		
+	def _getInMemoryPage(self, memory):
+		rows = self._getInMemoryRows(memory)
+		if self.paginate:
+			c = self._configs
+			start = (c.CurrentPage - 1)*c.RowsPerPage
+			rows = rows[start:start + c.RowsPerPage]
+		data = system.dataset.toDataSet(memory['headers'], rows)
+		return system.dataset.toPyDataSet(data)
+		
+	def _isLikeMatch(self, value, filter_):
+		# Equivalent of "value LIKE '%filter_%'" on a case insensitive collation,
+		# filter_ being the compiled pattern from _getLikeRegex().
+		if value is None:
+			return False
+		if isinstance(value, bool):
+			value = int(value)
+		return filter_.match(unicode(value)) is not None
+		
+	def _getSortKey(self, value):
+		# NULLs sort first and strings ignore case, matching SQL Server.
+		if isinstance(value, basestring):
+			value = value.lower()
+		return (value is not None, value)
+		
+	def invalidateInMemoryData(self, tables=None):
+		# Evict cached results that include any of the tables (full names), 
+		# defaults to every table in the configs.
+		if tables is None:
+			tables = [db.Table(table['name']).FullName for table in self._configs.Tables]
+		memoryCache = cache.Cache(self.IN_MEMORY_CACHE, self.IN_MEMORY_TTL, self.IN_MEMORY_CACHE_SIZE)
+		for table in tables:
+			memoryCache.invalidateTag((self.dataBase.Name, table))
 	
 	def getTotalRowCount(self):
 		# Total results row count.
+		memory = self._getInMemoryData()
+		if memory is not None:
+			return len(self._getInMemoryRows(memory))
 		q = self.getQuery()
 		data = q.execute(dataBase=self.dataBase.Name)
 		# Expecting integer but catching if is error type.
@@ -88,6 +291,20 @@ class PowerTable(object):
 			return data.Value
 		return data.getRowCount()
 	
+	def getDataAndRowCount(self, timeout=None):
+		from val import Error
+		# Data and total row count with the two queries run in parallel.
+		# Returns (data, rowCount), either may be a val.Error value.
+		memory = self._getInMemoryData()
+		if memory is not None:
+			return self._getInMemoryPage(memory), len(self._getInMemoryRows(memory))
+		data, count = qc.gather([self.Query.executeAsync(dataBase=self.dataBase.Name),
+								 self.getQuery().executeAsync(dataBase=self.dataBase.Name)], timeout)
+		if isinstance(data, Error):
+			data = data.Value
+		count = count.Value if isinstance(count, Error) else count.getRowCount()
+		return data, count
+		
 	def getTotalPageCount(self):
 		from val import Error
 		# Total results page count.
@@ -103,35 +320,53 @@ class PowerTable(object):
 		existingColumns = [col['name'].split('.')[1].strip(db.BRACKET_STRIP) 
 						   for col in c.configs['columns'] if col['isDisplayed']]
 		# Need to know how to alias column, so we need to know the table its coming from		
-		return [{'name': '{0}.[{1}]'.format(c.BaseTable['alias'], col.Name), 
-				 'characterMax': self._filterCharacterMax(col.characterMax), 
-				 'dataType': 'FK' if col.IsForeignKey else col.dataType, 
-				 'alias': col.Name if 'AutoID' not in col.Name else col.Name.replace('AutoID', ''), 
-				 'filter_': '', 
-				 'orderBy': '',
-				 'referenceTable': c.BaseTable['name'].replace('[', '').replace(']', '') 
-				 				   if not col.getFKReference() else col.getFKReference(),
-				 'isDisplayed': 1}
-				for col in c.BaseTableObj.Columns
-				if col.Name not in existingColumns and not col.IsAutoID]
+		return [self._getCandidateColumn(col, 1)
+				for col in self._getBaseColumnMetadata()
+				if col['name'] not in existingColumns and not col['isAutoID']]
 				
 	def getAllColumns(self):
 		c = self._configs
 		columns = c.configs['columns']
-		for col in c.BaseTableObj.Columns:
-			newColName = '{0}.[{1}]'.format(c.BaseTable['alias'], col.Name)
-			if not col.IsAutoID and newColName not in c.Columns:
-				newColumn = {'name': newColName,
-							 'characterMax': self._filterCharacterMax(col.characterMax),
-							 'dataType': 'FK' if col.IsForeignKey else col.dataType,
-							 'alias': col.Name if 'AutoID' not in col.Name else col.Name.replace('AutoID', ''),
-							 'filter_': '',
-							 'orderBy': '',
-							 'referenceTable': c.BaseTable['name'].replace('[', '').replace(']', '')
-							 				   if not col.getFKReference() else col.getFKReference(),
-							 'isDisplayed': 0} 
+		for col in self._getBaseColumnMetadata():
+			newColumn = self._getCandidateColumn(col, 0)
+			if not col['isAutoID'] and newColumn['name'] not in c.Columns:
 				columns.append(newColumn)
+		c.resetHash()
 		return columns
+		
+	def _getCandidateColumn(self, col, isDisplayed):
+		# Column configs for a base table column from its metadata.
+		c = self._configs
+		return {'name': '{0}.[{1}]'.format(c.BaseTable['alias'], col['name']), 
+				'characterMax': self._filterCharacterMax(col['characterMax']), 
+				'dataType': 'FK' if col['referenceTable'] else col['dataType'], 
+				'alias': col['name'] if 'AutoID' not in col['name'] else col['name'].replace('AutoID', ''), 
+				'filter_': '', 
+				'orderBy': '',
+				'referenceTable': c.BaseTable['name'].replace('[', '').replace(']', '') 
+								  if not col['referenceTable'] else col['referenceTable'],
+				'isDisplayed': isDisplayed}
+				
+	def _getBaseColumnMetadata(self):
+		from val import Error
+		# Base table column metadata, the column picker lists nothing on errors.
+		metadata = self._getColumnMetadata(self._configs.BaseTableObj)
+		return [] if isinstance(metadata, Error) else metadata
+		
+	def _getColumnMetadata(self, table):
+		from val import Error
+		# Column metadata from one bulk query, cached per (database, table) 
+		# so neither the column picker nor FK labels requery it.
+		key = (self.dataBase.Name, table.FullName)
+		metadataCache = cache.Cache(self.COLUMN_METADATA_CACHE, self.COLUMN_METADATA_TTL)
+		metadata = metadataCache.get(key)
+		if metadata is None:
+			metadata = table.getColumnMetadata()
+			# Expecting list but catches Error type, not cached.
+			if isinstance(metadata, Error):
+				return metadata
+			metadataCache.set(key, metadata, [key])
+		return metadata
 				
 	def _filterCharacterMax(self, characterMax):
 		# Maybe this should be in PTConfigs
@@ -141,10 +376,17 @@ class PowerTable(object):
 		return self.CHARACTER_MAX_DEFAULT
 			
 	def filterPotentialColumns(self, filter_, selections):
-		# Function for the 'AddColumn' search functionality.
+		# Function for the 'AddColumn' search functionality, filtered in memory
+		# from the cached base table metadata.
 		potentialCols = self.getPotentialColumns()
+		selected = set(selection['name'] for selection in selections)
 		return [col for col in potentialCols if filter_ in col['alias']
-					or col['name'] in [selection['name'] for selection in selections]]
+					or col['name'] in selected]
+		
+	def getColumnDescriptors(self):
+		# The column configs sent once per table when compactPayload is set, 
+		# headers and cells reference them by their index in this list.
+		return self.configs['columns']
 		
 	def getColumnHeaderInstances(self):
 		# Retrieving the column header instances (contained in 
@@ -152,45 +394,175 @@ class PowerTable(object):
 		flxr = component.FlexRepeater()
 		for i, col in enumerate(self.configs['columns']):
 			if col['isDisplayed']:
-				params = {'configs': self.configs,
-						  'instanceID': i}
+				if self.compactPayload:
+					params = {'columnIndex': i,
+							  'instanceID': i}
+				else:
+					params = {'configs': self.configs,
+							  'instanceID': i}
 				flxr.addInstances(1, params)
 		return flxr.Instances
 	
-	def getRowInstances(self, data):
+	def getRowInstances(self, data, start=0, count=None, labels=None):
 		# Retrieving the row instances (contained in 
-		# a flex repeater) from the data input param.
+		# a flex repeater) from the data input param. Only the rows
+		# from start to start + count are materialised if count is given.
+		# FK cells are given their 'label' from labels (see getFKLabels()).
 		flxr = component.FlexRepeater()
-		for i, row in enumerate(data):
-			params = {'row': [{'value': row[j],
-							   'column': self.configs['columns'][j/2],
-							   'cell': [i, j],
-							   'AutoID': row[j+1]}
-							   for j in range(len(row))
-							   if j%2 == 0 and self.configs['columns'][j/2]['isDisplayed']]}
+		end = len(data) if count is None else min(start + count, len(data))
+		columns = self.configs['columns']
+		displayed = [j for j in range(0, 2*len(columns), 2) if columns[j/2]['isDisplayed']]
+		for i in range(start, end):
+			row = data[i]
+			if self.compactPayload:
+				params = {'row': [{'value': row[j],
+								   'columnIndex': j/2,
+								   'cell': [i, j],
+								   'AutoID': row[j+1]}
+								   for j in displayed]}
+			else:
+				params = {'row': [{'value': row[j],
+								   'column': columns[j/2],
+								   'cell': [i, j],
+								   'AutoID': row[j+1]}
+								   for j in displayed]}
+			if labels:
+				for cell in params['row']:
+					column = columns[cell['cell'][1]/2]
+					if column['dataType'] == 'FK':
+						cell['label'] = labels.get(column['referenceTable'], {}).get(cell['value'])
 			flxr.addInstances(1, params)
 		return flxr.Instances
 		
-	def getCellInstances(self, row):
+	def getFKLabels(self, data, start=0, count=None):
+		# Resolve the primary ID labels of the FK values in the rows from start
+		# to start + count, one query per referenced table rather than per cell.
+		# Structured as {referenceTable: {AutoID: label}}.
+		end = len(data) if count is None else min(start + count, len(data))
+		autoIDs = {}
+		for i, col in enumerate(self.configs['columns']):
+			if col['dataType'] == 'FK' and col['isDisplayed']:
+				ids = autoIDs.setdefault(col['referenceTable'], set())
+				ids.update(data[k][2*i] for k in range(start, end)
+						   if not util.isNullValue(data[k][2*i]))
+		return {referenceTable: self._getPrimaryIDLabels(referenceTable, ids)
+				for referenceTable, ids in autoIDs.items()}
+		
+	def _getPrimaryIDLabels(self, referenceTable, autoIDs):
+		from val import Error
+		# Single IN query for the primary IDs of a set of AutoIDs.
+		if not autoIDs:
+			return {}
+		autoIDs = list(autoIDs)
+		table = db.Table(referenceTable, dataBase=self.dataBase.Name)
+		# AutoID and primary ID headers from the cached metadata, cells fall
+		# back to the value if they can't be found.
+		metadata = self._getColumnMetadata(table)
+		if isinstance(metadata, Error):
+			return {}
+		autoIDColumn = next((col['name'] for col in metadata if col['isAutoID']), None)
+		primaryIDColumn = next((col['name'] for col in metadata if col['isPrimaryID']), None)
+		if autoIDColumn is None or primaryIDColumn is None:
+			return {}
+		q = (Query().Select(['[{0}] AS AutoID'.format(autoIDColumn),
+							 '[{0}] AS ID'.format(primaryIDColumn)])
+					.From(table.FullName)
+					.Where(['[{0}] IN ({1})'.format(autoIDColumn, 
+													', '.join('?' for autoID in autoIDs))]))
+		data = q.execute(autoIDs, dataBase=self.dataBase.Name)
+		# Expecting PyDataset but catches Error type, cells fall back to the value.
+		if isinstance(data, Error):
+			return {}
+		return {row['AutoID']: row['ID'] for row in data}
+		
+	def getRowWindow(self, data, firstVisibleRow, visibleRowCount):
+		# Materialise the rows in the viewport plus ROW_WINDOW_BUFFER rows either
+		# side. The returned window can be passed to getNextRowWindow().
+		start = max(0, firstVisibleRow - self.ROW_WINDOW_BUFFER)
+		end = firstVisibleRow + visibleRowCount + self.ROW_WINDOW_BUFFER
+		return self._getRowWindow(data, start, end)
+		
+	def getNextRowWindow(self, data, window):
+		# Materialise the window of the same size following a previous window.
+		size = window['end'] - window['start']
+		return self._getRowWindow(data, window['end'], window['end'] + size)
+		
+	def _getRowWindow(self, data, start, end):
+		end = min(end, len(data))
+		labels = self.getFKLabels(data, start, end - start)
+		return {'start': start,
+				'end': end,
+				'rowCount': len(data),
+				'hasMore': end < len(data),
+				'labels': labels,
+				'instances': self.getRowInstances(data, start, end - start, labels)}
+		
+	def getCellInstances(self, row, start=0, count=None):
 		# Receives a row structured as is defined in the getRowInstances() 
-		# method.
+		# method. Only the cells from start to start + count are materialised
+		# if count is given, earlier cells just offset the left position.
+		layout = self.getColumnLayout()
 		vwc = component.ViewCanvas()
-		width = 0
-		for cell in row:
-			viewPath = self._getCellViewPath(cell['column']['dataType'])
+		end = len(row) if count is None else min(start + count, len(row))
+		for k in range(start, end):
+			cell = row[k]
+			# Cells are [rowIndex, dataIndex], each column followed by its AutoID
+			columnIndex = cell['cell'][1]/2
 			params = {'value': cell['value'],
 					  'originalValue': cell['value'],
-					  'column': cell['column'],
 					  'cell': cell['cell'],
 					  'AutoID': cell['AutoID']}
-			instance = component.VWCInstance(viewPath, params)
-			instance.setPosition(0, width)
-			w = cell['column']['characterMax']*self.COLUMN_WIDTH_RATIO
-			instance.setDimensions('auto', w)
-			width += w
+			# Compact cells carry the column index rather than the column
+			if 'columnIndex' in cell:
+				params['columnIndex'] = columnIndex
+			else:
+				params['column'] = cell['column']
+			# FK labels resolved for the page by getFKLabels()
+			if 'label' in cell:
+				params['label'] = cell['label']
+			instance = component.VWCInstance(layout[columnIndex]['viewPath'], params)
+			instance.instance.update(layout[columnIndex]['position'])
 			vwc.addInstance(instance)
 		return vwc.Instances
 		
+	def getColumnLayout(self):
+		# The view path and view canvas position of each column in the configs
+		# (None for columns not displayed). Cached on the column structure so
+		# every row of every table with the same columns shares one layout.
+		columns = self.configs['columns']
+		key = tuple((col['dataType'], col['characterMax'], bool(col['isDisplayed'])) 
+					for col in columns)
+		layoutCache = cache.Cache(self.LAYOUT_CACHE, None, self.LAYOUT_CACHE_SIZE)
+		layout = layoutCache.get(key)
+		if layout is None:
+			layout = layoutCache.set(key, self._getColumnLayout(columns))
+		return layout
+		
+	def _getColumnLayout(self, columns):
+		layout = []
+		left = 0
+		for col in columns:
+			if not col['isDisplayed']:
+				layout.append(None)
+				continue
+			width = col['characterMax']*self.COLUMN_WIDTH_RATIO
+			layout.append({'viewPath': self._getCellViewPath(col['dataType']),
+						   'width': width,
+						   'left': left,
+						   'position': {'top': '0px',
+										'left': '{0}px'.format(left),
+										'height': 'auto',
+										'width': '{0}px'.format(width)}})
+			left += width
+		return layout
+		
+	def getCellWindow(self, row, firstVisibleCell, visibleCellCount):
+		# Materialise the cells in the viewport plus CELL_WINDOW_BUFFER cells
+		# either side.
+		start = max(0, firstVisibleCell - self.CELL_WINDOW_BUFFER)
+		count = firstVisibleCell + visibleCellCount + self.CELL_WINDOW_BUFFER - start
+		return self.getCellInstances(row, start, count)
+		
 	def _getCellViewPath(self, dataType):
 		ints = [enums.DataType.INT.value, 
 				enums.DataType.SMALLINT.value, 
@@ -234,6 +606,12 @@ class PowerTable(object):
 			for AutoID in groupedChanges[table]:
 				result = db.Row(tableObj, AutoID).update(groupedChanges[table][AutoID])
 				results.append(result)
+			# Keep shared FK dropdown options referencing this table current.
+			component.Dropdown().refreshOptions(tableObj, groupedChanges[table].keys())
+			if tableObj.FullName == '[Asset].[Asset]':
+				AssetExplorer(self.dataBase).refreshSearchIndex(groupedChanges[table].keys())
+		# Cached in-memory results containing the changed tables are now stale.
+		self.invalidateInMemoryData(groupedChanges.keys())
 		# Either returns a list of rows affected (per AutoID) or val.Error obj.
 		return results
 		
@@ -252,7 +630,11 @@ class PowerTable(object):
 		table = db.Table(self.DB_TABLE_NAME, dataBase=self.ADMIN_DB)
 		row = db.Row(table, values[table.AutoIDColumnHeader])
 		# Either returns integer of # of rows affected or val.Error obj.
-		return row.update(values)
+		result = row.update(self._encodeConfigs(values))
+		# The stored configs' hash (version) changed, drop the parsed copy now.
+		self.invalidateViewConfig(values.get('viewConfig'))
+		self.invalidateTreeBrowser()
+		return result
 		
 	def createViewConfig(self, values):
 		from val import Error
@@ -270,7 +652,9 @@ class PowerTable(object):
 		table = db.Table(self.DB_TABLE_NAME, dataBase=self.ADMIN_DB)
 		row = db.Row(table)
 		# Either returns integer of # of rows affected or val.Error obj.
-		return row.create(values)
+		result = row.create(self._encodeConfigs(values))
+		self.invalidateTreeBrowser()
+		return result
 		
 	def registerViewConfig(self, ViewConfigAutoID, databaseAutoID):
 		# @@NEEDS_BUSINESS_LOGIC@@
@@ -279,13 +663,18 @@ class PowerTable(object):
 		row = db.Row(table)
 		values = {'ViewConfigAutoID': ViewConfigAutoID,
 				  'DatabaseAutoID': databaseAutoID}
-		return row.create(values)
+		result = row.create(values)
+		self.invalidateTreeBrowser()
+		return result
 		
 	def deleteViewConfig(self, values):
 		# @@NEEDS_BUSINESS_LOGIC@@
 		table = db.Table(self.DB_TABLE_NAME, dataBase=self.ADMIN_DB)
 		# Either returns integer of # of rows affected or val.Error obj.
-		return db.Row(table, values[table.AutoIDColumnHeader]).delete()
+		result = db.Row(table, values[table.AutoIDColumnHeader]).delete()
+		self.invalidateViewConfig(values.get('viewConfig'))
+		self.invalidateTreeBrowser()
+		return result
 		
 	def deregisterViewConfig(self, ViewConfigAutoID, databaseAutoID):
 		# @@NEEDS_BUSINESS_LOGIC@@
@@ -294,7 +683,9 @@ class PowerTable(object):
 		table = db.Table('PowerTable.ViewConfigRegisteredDatabase', dataBase=self.ADMIN_DB)
 		values = {'ViewConfigAutoID': ViewConfigAutoID,
 				  'DatabaseAutoID': databaseAutoID}
-		return db.Row(table, filters=values).delete()
+		result = db.Row(table, filters=values).delete()
+		self.invalidateTreeBrowser()
+		return result
 	
 	def isRegistered(self, ViewConfigAutoID):
 		# Check to see if view is registered on any db
@@ -309,13 +700,21 @@ class PowerTable(object):
 		#		   before taking action
 		return None
 		
-	def isConfigs(self, currentConfigs):
+	def isConfigs(self, currentConfigs, currentHash=None):
 		# Checking if some configs are equal to the object configs,
-		# disregarding if the page number is different.
-		differences = util.deepDiff(self.configs, currentConfigs)
-		if differences.keys() == ['root.pager.currentPage']:
-			return True
-		return not bool(differences)
+		# disregarding if the page number is different. Comparing structural
+		# hashes, pass the getConfigsHash() saved with currentConfigs to skip 
+		# hashing them.
+		if currentHash is None:
+			currentHash = util.getStructuralHash(currentConfigs, PTConfigs.VOLATILE_PATHS)
+		return currentHash == self._configs.Hash
+		
+	def getConfigsHash(self):
+		return self._configs.Hash
+		
+	def getConfigsDiff(self, currentConfigs):
+		# Full deepDiff() of the configs, only computed when asked for.
+		return util.deepDiff(self.configs, currentConfigs)
 
 
 class PTConfigs(object):
@@ -336,9 +735,26 @@ class PTConfigs(object):
 									 'columnJoin': '',
 									 'joinType': ''}]}	
 	
+	# Paths left out of the structural hash, changing them doesn't change the view.
+	VOLATILE_PATHS = [('pager', 'currentPage')]
+	
 	def __init__(self, configs=None, dataBase=None):
 		self.configs = configs if configs else deepcopy(PTConfigs.CONFIGS_TEMPLATE)
 		self.dataBase = util.getDatabaseObj(dataBase)
+		# Cache
+		self._hash = None
+		
+	@property
+	def Hash(self):
+		# Structural hash of the configs (see VOLATILE_PATHS). Kept until the 
+		# configs are changed through this object, call resetHash() after 
+		# changing self.configs directly.
+		if self._hash is None:
+			self._hash = util.getStructuralHash(self.configs, self.VOLATILE_PATHS)
+		return self._hash
+		
+	def resetHash(self):
+		self._hash = None
 	
 	@property
 	def Columns(self):
@@ -352,10 +768,13 @@ class PTConfigs(object):
 	def OrderBy(self):
 		clauses =  ['{0} {1}'.format(col['name'], col['orderBy']) for col in self.configs['columns']
 					if col['orderBy']]
+		return self.DefaultOrderBy if len(clauses) == 0 else clauses
+		
+	@property
+	def DefaultOrderBy(self):
 		# Default the base table's AutoID column ASC
 		alias = self.BaseTable['alias'] if self.BaseTable['alias'] else self.BaseTableObj.Alias
-		default = ['{0}.[{1}]'.format(alias, self.BaseTableObj.AutoIDColumnHeader)]
-		return default if len(clauses) == 0 else clauses
+		return ['{0}.[{1}]'.format(alias, self.BaseTableObj.AutoIDColumnHeader)]
 	
 	@property	
 	def Pager(self):
@@ -412,6 +831,7 @@ class PTConfigs(object):
 				if newPos < 0:
 					break
 				columns.insert(newPos, columns.pop(i))
+				self.resetHash()
 				break
 		return self.configs
 		
@@ -422,11 +842,13 @@ class PTConfigs(object):
 			self.configs['columns'].append(column)
 		else:
 			self.configs['columns'].insert(pos, column)
+		self.resetHash()
 		return self.configs
 		
 	def removeColumn(self, pos):
 		# Remove a column from a position in the configs attribtue
 		self.configs['columns'].pop(pos)
+		self.resetHash()
 		return self.configs
 		
 	def getColumnsWithAutoIDs(self):
@@ -469,10 +891,40 @@ class PTTreeBrowser(object):
 					   'Reports']
 	FOLDER_ICON_DEFAULT = 'material/folder'
 	VIEW_ICON_DEFAULT = 'material/table_view'
+	# Built trees by database, cleared by PowerTable().invalidateTreeBrowser()
+	TREE_CACHE = 'PTTreeBrowser.Items'
+	TREE_GENERATION_CACHE = 'PTTreeBrowser.Generation'
 	
 	def __init__(self, items=None):
 		self.items = items if items else self._initializeItems()
 		
+	def getItemsFromDatabase(self, activeDatabase):
+		from val import Error
+		# Every view registered on the activeDatabase string from one query,
+		# added to the tree in one pass. The tree is cached by database.
+		treeCache = cache.Cache(self.TREE_CACHE, None)
+		items = treeCache.get(activeDatabase)
+		if items is None:
+			generation = cache.Cache(self.TREE_GENERATION_CACHE, None).get('generation', 0)
+			q = (qc.Query().Select(['vc.ViewConfigAutoID', 'vc.viewConfig', 'vc.Path'])
+						   .From('PowerTable.ViewConfig', 'vc')
+						   .Join('PowerTable.ViewConfigRegisteredDatabase', 'PowerTable.ViewConfig', 'rdb', 'vc', 'rdb.ViewConfigAutoID = vc.ViewConfigAutoID')
+						   .Join('Enum.[Database]', 'PowerTable.ViewConfigRegisteredDatabase', 'db', 'rdb', 'db.DatabaseAutoID = rdb.DatabaseAutoID')
+						   .Where(['db.[Database] = ?']))
+			data = q.execute([activeDatabase], dataBase=self.ADMIN_DB)
+			if isinstance(data, Error):
+				return data.Value
+			# Built on the default folders, self.items may be a session's tree.
+			t = component.Tree(PTTreeBrowser().items)
+			i = component.Icon(self.VIEW_ICON_DEFAULT)
+			items = t.addItems([(row['Path'], row['viewConfig'], row['ViewConfigAutoID']) 
+								for row in data], icon=i)
+			if cache.Cache(self.TREE_GENERATION_CACHE, None).get('generation', 0) == generation:
+				treeCache.set(activeDatabase, items)
+		# Items are expanded/collapsed in place so never hand out the cached list.
+		self.items = deepcopy(items)
+		return self.items
+		
 	def getAutoIDs(self, activeDatabase):
 		# Retrieve the autoIDs of viewConfigs that are registered on the activeDatabase string
 		q = (qc.Query().Select(['vc.ViewConfigAutoID'])
@@ -480,7 +932,7 @@ class PTTreeBrowser(object):
 					   .Join('PowerTable.ViewConfigRegisteredDatabase', 'PowerTable.ViewConfig', 'rdb', 'vc', 'rdb.ViewConfigAutoID = vc.ViewConfigAutoID')
 					   .Join('Enum.[Database]', 'PowerTable.ViewConfigRegisteredDatabase', 'db', 'rdb', 'db.DatabaseAutoID = rdb.DatabaseAutoID')
 					   .Where(['db.[Database] = ?']))
-		data = q.execute([activeDatabase], dataBase=self.ADMIN_DB)
+		data = q.execute([activeDatabase], dataBase=self.ADMIN_DB, useCache=True)
 		return [row[0] for row in data]
 		
 	def _initializeItems(self):
@@ -517,10 +969,12 @@ class PTTreeBrowser(object):
 		return self.items
 		
 	def getItemsFromAutoIDs(self, AutoIDs):
-		# Get items to populate tree from list of AutoIDs
+		# Get items to populate tree from list of AutoIDs, added in one pass.
 		values = self._getValuesFromAutoIDs(AutoIDs)
-		for i, val in enumerate(values):
-			self.addView(val['viewConfig'], val['Path'], val['ViewConfigAutoID'])
+		t = component.Tree(self.items)
+		i = component.Icon(self.VIEW_ICON_DEFAULT)
+		self.items = t.addItems([(val['Path'], val['viewConfig'], val['ViewConfigAutoID']) 
+								 for val in values], icon=i)
 		return self.items
 	
 	# Decrement?
@@ -534,6 +988,17 @@ class PTTreeBrowser(object):
 		self.items = t.openItemPath(path)
 		return self.items
 		
+	def getOpenViewPatch(self, path, expandedPaths=None):
+		# Opens the path and returns only the {path: expanded} changes, apply 
+		# them to the session with component.Tree().applyPatch(patch, items).
+		# Store the returned expandedPaths on the session and pass them back
+		# on the next click, the tree is only walked for them when missing.
+		# Returns {'patch', 'expandedPaths'}
+		t = component.Tree(self.items, expandedPaths)
+		patch = t.getOpenItemPatch(path)
+		return {'patch': patch, 
+				'expandedPaths': sorted(t.ExpandedPaths)}
+		
 	def setItemsCollapsed(self):
 		t = component.Tree(self.items)
 		return t.setItemsCollapsed()
@@ -547,50 +1012,101 @@ class Grid(object):
 	""" Grid object used in dashboard and viewcanvas. """
 	
 	def __init__(self, rowCount, columnCount):
-		# Initializing the Grid's data (list of lists)
-		self.data = [[0]*columnCount for _ in range(rowCount)]
+		# Occupancy is a bitmask per row, bit j set when column j is taken.
 		self.rowCount = rowCount
 		self.columnCount = columnCount
+		self._fullRow = (1 << columnCount) - 1
+		self.rows = [0]*rowCount
+		# Placement hints rather than a full free space index (skyline or
+		# maximal rectangles): the first row with a free cell and the row each
+		# (width, length) was last placed from. Cells only fill up between 
+		# removals so no rectangle that size fits above that row.
+		self._firstFreeRow = 0
+		self._rowHints = {}
+		
+	@property
+	def data(self):
+		# The grid as a list of lists of 0/1.
+		return [[(row >> j) & 1 for j in range(self.columnCount)] for row in self.rows]
 	
 	def addRectangle(self, x, y, width, length):
-		self._addRemoveRectangle(x, y, width, length, 1)
+		mask = self._getMask(y, width)
+		for i in range(x, (x + length)):
+			self.rows[i] |= mask
+		while self._firstFreeRow < self.rowCount and self.rows[self._firstFreeRow] == self._fullRow:
+			self._firstFreeRow += 1
 		
 	def removeRectangle(self, x, y, width, length):		
-		self._addRemoveRectangle(x, y, width, length, 0)
-		
-	def _addRemoveRectangle(self, x, y, width, length, val):
+		mask = ~self._getMask(y, width)
 		for i in range(x, (x + length)):
-			for j in range(y, (y + width)):
-				self.data[i][j] = val
+			self.rows[i] &= mask
+		self._firstFreeRow = min(self._firstFreeRow, x)
+		self._rowHints = {}
+		
+	def isFree(self, x, y, width, length):
+		# True if no cell of the rectangle is taken and it's inside the grid.
+		if x < 0 or y < 0 or x + length > self.rowCount or y + width > self.columnCount:
+			return False
+		mask = self._getMask(y, width)
+		return not any(self.rows[i] & mask for i in range(x, x + length))
+		
+	def _getMask(self, y, width):
+		return ((1 << width) - 1) << y
 				
 	def clear(self):
-		self.data = [[0]*self.columnCount for _ in range(self.rowCount)]
+		self.rows = [0]*self.rowCount
+		self._firstFreeRow = 0
+		self._rowHints = {}
 	
 	def placeRectangle(self, width, length):
-		startCell = self._findStartCell()
-		# Check to see if rectangle will fit in that location
-		rowStart, columnStart = startCell
-		rowEnd = rowStart + length
-		columnEnd = columnStart + width
-		
-		if columnEnd <= self.columnCount and rowEnd <= self.rowCount:
-			self.addRectangle(rowStart, columnStart, width, length)
-			topLeftCorner = (rowStart, columnStart)
-		else:
-			self.addRectangle(rowStart + length, 1, width, length)
-			topLeftCorner = (rowStart + length, 1)
-		return topLeftCorner
-	
-	def _findStartCell(self):
-		for i in range(self.rowCount):
-			for j in range(self.columnCount):
-				if self.data[i][j] == 0:
-					startCell = (i, j)
-					return startCell
+		# Place a rectangle at the first free top left corner (row, column) it
+		# fits in without overlapping, returns None if there's no room.
+		corner = self._findCorner(width, length)
+		if corner is None:
+			return None
+		self.addRectangle(corner[0], corner[1], width, length)
+		self._rowHints[(width, length)] = corner[0]
+		return corner
+		
+	def placeRectangles(self, sizes):
+		# Batch placement of [(width, length), ...] in order, returns their
+		# top left corners (None where there's no room).
+		return [self.placeRectangle(width, length) for width, length in sizes]
+	
+	def _findCorner(self, width, length):
+		# Linear scan from the hinted row. Rows are OR'ed over the rectangle's
+		# length so a whole row of columns is tested at once for a run of 
+		# width free cells, worst case rowCount*length row ORs per placement.
+		if width > self.columnCount or length > self.rowCount:
+			return None
+		start = max(self._firstFreeRow, self._rowHints.get((width, length), 0))
+		for i in range(start, self.rowCount - length + 1):
+			if self.rows[i] == self._fullRow:
+				continue
+			taken = 0
+			for row in self.rows[i:i + length]:
+				taken |= row
+			fits = self._getRuns(~taken & self._fullRow, width)
+			if fits:
+				return (i, (fits & -fits).bit_length() - 1)
+		return None
+		
+	def _getRuns(self, free, width):
+		# Bit j is left set when columns j to j + width - 1 are all free.
+		covered = 1
+		while covered < width:
+			shift = min(covered, width - covered)
+			free &= free >> shift
+			covered += shift
+		return free
 					
 
 class SearchTextField(object):
 	""" Search Text Field component object. """    
+	
+	# Search view descriptors by (database, searchView), kept for the 
+	# gateway's life.
+	SEARCH_VIEW_CACHE = 'SearchTextField.SearchViews'
     
 	def __init__(self, text, searchView, dataBase=None):		
 		self.text = text 
@@ -601,32 +1117,71 @@ class SearchTextField(object):
 		self._SearchText = None
 		
 		self._checkForColumnSearch()
+		
+	@property
+	def SearchView(self):
+		from val import Error
+		# The search view's columns by position, resolved with one metadata
+		# query the first time a (database, searchView) is searched.
+		# {'idColumn', 'keywordColumn', 'columnNameColumn'}
+		key = (self.dataBase.Name, self.searchView.FullName)
+		viewCache = cache.Cache(self.SEARCH_VIEW_CACHE, None)
+		descriptor = viewCache.get(key)
+		if descriptor is None:
+			metadata = self.searchView.getColumnMetadata()
+			# Expecting list but catches val.Error types.
+			if isinstance(metadata, Error):
+				return metadata
+			if len(metadata) < 3:
+				return Error(enums.Message.HANDLED_FAILURE.value, 
+							 'Search view {0} needs ID, keyword and column name columns.'.format(self.searchView.FullName))
+			descriptor = viewCache.set(key, {'idColumn': metadata[0]['name'],
+											 'keywordColumn': metadata[1]['name'],
+											 'columnNameColumn': metadata[2]['name']})
+		return descriptor
     
-	def getSearchIDs(self):
+	def getSearchIDs(self, sessionID=None, componentID=None, timeout=None):
 		from val import Error
+		# Pass the session id and the field's componentID (ie its view and 
+		# component path) so a search superseded by the field's next keystroke
+		# is cancelled.
+		view = self.SearchView
+		if isinstance(view, Error):
+			return view.Value
+		whereClause = []
+		args = []
 		if self._isColumnSearch == True:
 			self._Column, self._SearchText = self.getColumnAndText()
+			whereClause.append('{0} = ?'.format(view['columnNameColumn']))
+			args.append(self._Column)
 			if (self._Column != None) and (self._SearchText != None):
-				whereClause = ["{0} = '{1}' AND {2} LIKE '{3}'".format(self.searchView.Columns[2].Name,
-																	   self._Column,
-																	   self.searchView.Columns[1].Name, 
-												  					   _WildcardHandler(self._SearchText).getSQLString())]
-			else:
-				whereClause = ["{0} = '{1}'".format(self.searchView.Columns[2].Name, 
-													self._Column)]
-		
+				self._addSearchClauses(whereClause, args, view['keywordColumn'], self._SearchText)
 		else:
-			whereClause = ["{0} LIKE '{1}'".format(self.searchView.Columns[1].Name, 
-												   _WildcardHandler(self.text).getSQLString())]
+			self._addSearchClauses(whereClause, args, view['keywordColumn'], self.text)
 		
 		q = (Query()
-			.Select([self.searchView.Columns[0].Name], distinct=True)
+			.Select([view['idColumn']], distinct=True)
 			.From(self.searchView.FullName)
 			.Where(whereClause))
-		results = q.execute(dataBase=self.dataBase.Name)
+		if sessionID is not None and componentID is not None:
+			latest = qc.LatestWins(sessionID, 'SearchTextField.{0}'.format(componentID))
+			results = latest.execute(q, args, self.dataBase.Name, timeout)
+		else:
+			results = q.execute(args, dataBase=self.dataBase.Name, timeout=timeout)
 		if isinstance(results, Error):
 			return results.Value
 		return [result[0] for result in results]
+		
+	def _addSearchClauses(self, whereClause, args, keywordColumn, text):
+		# Parameterized LIKE on the keyword column. A literal prefix also gets
+		# a range predicate the index can seek on (lower bound only, an upper
+		# bound depends on the collation).
+		pattern = _WildcardHandler(text).Pattern
+		whereClause.append('{0} LIKE ?'.format(keywordColumn))
+		args.append(pattern['like'])
+		if pattern['prefix']:
+			whereClause.append('{0} >= ?'.format(keywordColumn))
+			args.append(pattern['prefix'])
 	
 	def _checkForColumnSearch(self):
 		text = self.text
@@ -636,7 +1191,7 @@ class SearchTextField(object):
 			self._isColumnSearch = True
 	
 	def getColumnAndText(self):
-		text = self.text.remove("[column]:")
+		text = self.text.replace("[column]:", "")
 		text = text.lstrip()
 		splitText = text.split(" ", 1)
 		if len(splitText) == 2:
@@ -649,51 +1204,65 @@ class SearchTextField(object):
 class _WildcardHandler(object):
 	""" Wildcard Handler for SearchTextField class. """    
 	
-	# Placeholders
-	LITERAL_TILDE = "__TILDE__"    
-	LITERAL_ASTERISK = "__ASTERISK__"    
-	LITERAL_QUESTIONMARK = "__QUESTIONMARK__"    
+	# Search syntax, '~' escapes the next character.
+	ESCAPE = "~"
+	WILDCARDS = {"*": "%", "?": "_"}
+	# Characters LIKE treats as wildcards, matched literally with brackets.
+	LIKE_SPECIAL = "%_["
+	# Compiled patterns by search text
+	PATTERN_CACHE = 'SearchTextField.WildcardPatterns'
+	PATTERN_CACHE_SIZE = 500
 	
 	def __init__(self, text):
 		self.text = text
+		
+	@property
+	def Pattern(self):
+		# {'like': LIKE pattern, 'prefix': literal text before the first 
+		# wildcard of an anchored pattern, 'isAnchored': bool}
+		patternCache = cache.Cache(self.PATTERN_CACHE, None, self.PATTERN_CACHE_SIZE)
+		pattern = patternCache.get(self.text)
+		if pattern is None:
+			pattern = patternCache.set(self.text, self._compile(self.text))
+		return pattern
 			
 	def getSQLString(self):
-		text = self.text
-		if text.endswith("~") and not text.endswith("~~"):
-			text = text[0:text.rindex("~")]
-		if text.find("~") == text.find("*") == text.find("?"):
-			return '%{0}%'.format(text)
-		else:
-			text = self._transformTilde(text)
-			text = self._transformAsterisk(text)
-			text = self._transformQuestionMark(text)
-			text = self._transformLiteral(text)
-		return text
-	
-	def _transformTilde(self, text):
-		while text.find("~") != -1:
-			escapedCharacter = text[text.find("~") + 1]
-			if escapedCharacter == "~":
-				text = text.replace("~~", _WildcardHandler.LITERAL_TILDE)
-			elif escapedCharacter == "*":
-				text = text.replace("~*", _WildcardHandler.LITERAL_ASTERISK)
-			elif escapedCharacter == "?":
-				text = text.replace("~?", _WildcardHandler.LITERAL_QUESTIONMARK)
+		return self.Pattern['like']
+		
+	def _compile(self, text):
+		# Text without any of the syntax characters (once a trailing escape is
+		# dropped) matches anywhere, otherwise the pattern is anchored at both ends.
+		if text.endswith(self.ESCAPE) and not text.endswith(self.ESCAPE*2):
+			text = text[:-1]
+		if not any(char in text for char in (self.ESCAPE, ) + tuple(self.WILDCARDS)):
+			return {'like': '%{0}%'.format(''.join(self._getLiteral(char) for char in text)),
+					'prefix': '',
+					'isAnchored': False}
+		like = []
+		prefix = []
+		isPrefix = True
+		i = 0
+		while i < len(text):
+			char = text[i]
+			if char == self.ESCAPE:
+				if i + 1 < len(text):
+					like.append(self._getLiteral(text[i + 1]))
+					if isPrefix:
+						prefix.append(text[i + 1])
+				i += 2
+				continue
+			if char in self.WILDCARDS:
+				like.append(self.WILDCARDS[char])
+				isPrefix = False
 			else:
-				text = text.replace("~{0}".format(escapedCharacter), "[{0}]".format(escapedCharacter))
-		return text
+				like.append(self._getLiteral(char))
+				if isPrefix:
+					prefix.append(char)
+			i += 1
+		return {'like': ''.join(like), 'prefix': ''.join(prefix), 'isAnchored': True}
 		
-	def _transformAsterisk(self, text):
-		return text.replace("*", "%")
-	
-	def _transformQuestionMark(self, text):
-		return text.replace("?", "_")
-	
-	def _transformLiteral(self, text):
-		text = text.replace(_WildcardHandler.LITERAL_TILDE, "[~]")
-		text = text.replace(_WildcardHandler.LITERAL_ASTERISK, "[*]")
-		text = text.replace(_WildcardHandler.LITERAL_QUESTIONMARK, "[?]")
-		return text
+	def _getLiteral(self, char):
+		return '[{0}]'.format(char) if char in self.LIKE_SPECIAL else char
 		
 class UserDirectory(object):
 	""" User directory custom component object. """
@@ -790,6 +1359,25 @@ class AssetExplorer(object):
 				   widget.SystemWidget,
 				   widget.UserFieldWidget,
 				   widget.ProcurementWidget]
+	# Gateway inverted index of dbo.vSearchKeywordsAsset by database, keyword 
+	# substrings of NGRAM_LENGTH characters to the SearchIDs containing them.
+	# Rebuilt in the background once older than SEARCH_INDEX_TTL, catching
+	# changes that never went through refreshSearchIndex.
+	SEARCH_INDEX_CACHE = 'AssetExplorer.SearchIndex'
+	SEARCH_INDEX_TTL = 3600
+	SEARCH_INDEX_BUILD_TIMEOUT = 300
+	NGRAM_LENGTH = 3
+	# Last search per session, refined in memory while the user keeps typing.
+	# Bounded as ended sessions never read theirs again.
+	SESSION_SEARCH_CACHE = 'AssetExplorer.SessionSearch'
+	SESSION_SEARCH_TTL = 600
+	SESSION_SEARCH_SIZE = 500
+	# Gateway wide LRU of recent (popular) search terms.
+	POPULAR_SEARCH_CACHE = 'AssetExplorer.PopularSearch'
+	POPULAR_SEARCH_TTL = 600
+	POPULAR_SEARCH_SIZE = 200
+	# Search results are returned a page at a time.
+	SEARCH_PAGE_SIZE = 50
 	
 	def __init__(self, dataBase):
 		self.dataBase = util.getDatabaseObj(dataBase)
@@ -798,7 +1386,7 @@ class AssetExplorer(object):
 		from val import Error
 		# Retrieve a user's pinned asset flxr instances
 		q = qc.Query().Select(['AssetAutoID']).From('Asset.UserPin').Where(['Username = ?'])
-		data = q.execute([username], dataBase=self.dataBase.Name)
+		data = q.execute([username], dataBase=self.dataBase.Name, useCache=True)
 		if isinstance(data, Error):
 			return data.Value
 		
@@ -808,23 +1396,242 @@ class AssetExplorer(object):
 			flxr.addInstances(1, params)
 		return flxr.Instances
 		
-	def getSearchItems(self, search):
+	def getSearchItems(self, search, sessionID=None, continuation=None):
+		# Get a page of search item instances from a search term, see 
+		# getSearchPage() for the continuation and "see more" alert.
+		page = self.getSearchPage(search, sessionID, continuation)
+		return page['instances'] if 'instances' in page else page
+		
+	def getSearchPage(self, search, sessionID=None, continuation=None, pageSize=None):
+		from val import Error
+		# A page of search item instances ordered by Title, answered by the
+		# search index unless it's cold. Pass the session id to narrow the
+		# session's previous results while typing, and the continuation of
+		# the previous page to get the next one.
+		# Returns {'instances', 'hasMore', 'continuation', 'alert'}
+		pageSize = pageSize if pageSize else self.SEARCH_PAGE_SIZE
+		AutoIDs = self.getSearchIDs(search, sessionID)
+		rows = None
+		if AutoIDs is not None:
+			rows = self._sliceSearchPage(AutoIDs, continuation, pageSize)
+		# Also when the index was invalidated after the search.
+		if rows is None:
+			rows = self._querySearchPage(search, continuation, pageSize)
+		if isinstance(rows, Error):
+			return rows.Value
+		# One row past the page is fetched to tell if there are more.
+		hasMore = len(rows) > pageSize
+		rows = rows[:pageSize]
+		
+		flxr = component.FlexRepeater()
+		for AutoID, title, offset in rows:
+			params = {'AutoID': AutoID}
+			flxr.addInstances(1, params)
+		if hasMore:
+			alert = enums.Alert.SeeMore.value
+		elif not rows and continuation is None:
+			alert = enums.Alert.NoResults.value
+		else:
+			alert = None
+		return {'instances': flxr.Instances,
+				'hasMore': hasMore,
+				'continuation': {'title': rows[-1][1], 'AutoID': rows[-1][0], 'offset': rows[-1][2]} if hasMore else None,
+				'alert': alert}
+				
+	def _querySearchPage(self, search, continuation, pageSize):
 		from val import Error
-		# Get all search item instances from a search term
-		q = (Query().Select(['agi.AutoID', 'agi.Title', 'agi.SubTitle'], distinct=True)
+		# TOP page from the keyset (Title, AutoID) of the continuation. The
+		# Title is ordered the same null safe way it's compared, DISTINCT
+		# needs it selected that way too.
+		clauses = ['ask.Keywords LIKE ?']
+		args = ['%{0}%'.format(search)]
+		if continuation:
+			clauses.append("(ISNULL(agi.Title, '') > ? OR (ISNULL(agi.Title, '') = ? AND agi.AutoID > ?))")
+			args.extend([continuation['title'] or '', continuation['title'] or '', continuation['AutoID']])
+		q = (Query().Select(['agi.AutoID', "ISNULL(agi.Title, '') AS Title"], distinct=True, top=pageSize + 1)
 					.From('Asset.vAssetGalleryInstance', 'agi')
 					.Join('dbo.vSearchKeywordsAsset', 'Asset.vAssetGalleryInstance', 'ask', 'agi', 'ask.SearchID = agi.AutoID')
-					.Where(["ask.Keywords LIKE '%{0}%'".format(search)])
-					.OrderBy(['agi.Title']))
-		data = q.execute(dataBase=self.dataBase.Name)
+					.Where(clauses)
+					.OrderBy(["ISNULL(agi.Title, '')", 'agi.AutoID']))
+		data = q.execute(args, dataBase=self.dataBase.Name)
+		if isinstance(data, Error):
+			return data
+		return [(row['AutoID'], row['Title'], None) for row in data]
+		
+	def _sliceSearchPage(self, AutoIDs, continuation, pageSize):
+		# Page of the indexed results after the continuation. Its offset is
+		# used while the results are unchanged, otherwise the keyset is found.
+		# None if the index is gone by now.
+		index = self._getSearchIndex()
+		if index is None:
+			return None
+		titles = index['titles']
+		start = 0
+		if continuation:
+			offset = continuation.get('offset')
+			if offset and offset <= len(AutoIDs) and AutoIDs[offset - 1] == continuation['AutoID']:
+				start = offset
+			else:
+				keyset = ((continuation['title'] or '').lower(), continuation['AutoID'])
+				start = next((i for i, AutoID in enumerate(AutoIDs) 
+							  if ((titles.get(AutoID) or '').lower(), AutoID) > keyset), len(AutoIDs))
+		return [(AutoID, titles.get(AutoID), start + i + 1) 
+				for i, AutoID in enumerate(AutoIDs[start:start + pageSize + 1])]
+		
+	def getSearchIDs(self, search, sessionID=None):
+		# AutoIDs of the assets whose keywords contain search (case insensitive,
+		# no wildcards) ordered by Title. None while the index is cold, it's 
+		# built in the background meanwhile.
+		index = self._getSearchIndex()
+		if index is None:
+			return None
+		term = search.lower()
+		# Cached results are only good for the index version they came from.
+		popularCache = cache.Cache(self.POPULAR_SEARCH_CACHE, self.POPULAR_SEARCH_TTL, self.POPULAR_SEARCH_SIZE)
+		entry = popularCache.get((self.dataBase.Name, term))
+		if entry is None or entry['version'] != index['version']:
+			entry = {'term': term, 
+					 'version': index['version'], 
+					 'AutoIDs': self._refineSearchIDs(index, term, sessionID)}
+			popularCache.set((self.dataBase.Name, term), entry)
+		if sessionID is not None:
+			sessionCache = cache.Cache(self.SESSION_SEARCH_CACHE, self.SESSION_SEARCH_TTL, self.SESSION_SEARCH_SIZE)
+			sessionCache.set((self.dataBase.Name, sessionID), entry)
+		return list(entry['AutoIDs'])
+		
+	def _refineSearchIDs(self, index, term, sessionID):
+		# A term containing the session's previous term can only match a 
+		# subset of its results, filtered in memory keeping the Title order.
+		if sessionID is not None:
+			sessionCache = cache.Cache(self.SESSION_SEARCH_CACHE, self.SESSION_SEARCH_TTL, self.SESSION_SEARCH_SIZE)
+			previous = sessionCache.get((self.dataBase.Name, sessionID))
+			if previous is not None and previous['version'] == index['version'] and previous['term'] in term:
+				keywords = index['keywords']
+				return [AutoID for AutoID in previous['AutoIDs'] 
+						if term in keywords.get(AutoID, '')]
+		return self._searchIndex(index, term)
+		
+	def _searchIndex(self, index, term):
+		keywords = index['keywords']
+		if len(term) < self.NGRAM_LENGTH:
+			candidates = keywords.keys()
+		else:
+			# Intersect smallest posting sets first, then drop the candidates
+			# whose ngrams only appear out of order.
+			postings = sorted((index['ngrams'].get(ngram, set()) for ngram in self._getNGrams(term)), key=len)
+			candidates = set(postings[0])
+			for posting in postings[1:]:
+				if not candidates:
+					break
+				candidates &= posting
+		titles = index['titles']
+		return sorted((AutoID for AutoID in candidates if term in keywords.get(AutoID, '')),
+					  key=lambda AutoID: ((titles.get(AutoID) or '').lower(), AutoID))
+					  
+	def _getSearchIndex(self):
+		searchCache = cache.Cache(self.SEARCH_INDEX_CACHE, None)
+		index = searchCache.get(self.dataBase.Name)
+		# A stale index is still served while its replacement is built.
+		if index is None or time.time() - index['version'][0] > self.SEARCH_INDEX_TTL:
+			# Marked with a timeout so a failed build is retried.
+			marker = object()
+			if searchCache.setDefault((self.dataBase.Name, 'isBuilding'), marker, ttl=self.SEARCH_INDEX_BUILD_TIMEOUT) is marker:
+				system.util.invokeAsynchronous(self.buildSearchIndex)
+		return index
+		
+	def buildSearchIndex(self):
+		from val import Error
+		# Full build of the search index, returns the number of assets indexed.
+		data = self._getSearchRows()
 		if isinstance(data, Error):
 			return data.Value
+		keywords = {}
+		titles = {}
+		for row in data:
+			keywords.setdefault(row['SearchID'], []).append((row['Keywords'] or '').lower())
+			titles[row['SearchID']] = row['Title']
+		# Not shared yet so the posting sets are built in place. The version
+		# (build time, refresh count) tells cached results are stale.
+		index = {'keywords': {}, 'titles': titles, 'ngrams': {}, 'version': (time.time(), 0)}
+		for AutoID, values in keywords.items():
+			text = index['keywords'][AutoID] = '\n'.join(values)
+			for ngram in self._getNGrams(text):
+				index['ngrams'].setdefault(ngram, set()).add(AutoID)
+		searchCache = cache.Cache(self.SEARCH_INDEX_CACHE, None)
+		searchCache.set(self.dataBase.Name, index)
+		searchCache.invalidate((self.dataBase.Name, 'isBuilding'))
+		# Changes refreshed while building may be missing from the rows read,
+		# they're applied to the new index now. Later ones go straight to it.
+		pending = searchCache.get((self.dataBase.Name, 'pendingRefresh'))
+		searchCache.invalidate((self.dataBase.Name, 'pendingRefresh'))
+		if pending:
+			self.refreshSearchIndex(set(pending))
+		return len(keywords)
 		
-		flxr = component.FlexRepeater()
+	def refreshSearchIndex(self, AutoIDs):
+		from val import Error
+		# Re-index the keywords of changed (or deleted) assets. Queued for the
+		# build running now, if any, as it may have read them before the change.
+		# Otherwise nothing to do while the index is cold, the next build reads
+		# them anyway.
+		searchCache = cache.Cache(self.SEARCH_INDEX_CACHE, None)
+		AutoIDs = list(AutoIDs)
+		if not AutoIDs:
+			return None
+		if searchCache.has((self.dataBase.Name, 'isBuilding')):
+			searchCache.setDefault((self.dataBase.Name, 'pendingRefresh'), []).extend(AutoIDs)
+		index = searchCache.get(self.dataBase.Name)
+		if index is None:
+			return None
+		data = self._getSearchRows(AutoIDs)
+		if isinstance(data, Error):
+			searchCache.invalidate(self.dataBase.Name)
+			return data.Value
+		keywords = dict((AutoID, []) for AutoID in AutoIDs)
 		for row in data:
-			params = {'AutoID': row['AutoID']}
-			flxr.addInstances(1, params)
-		return flxr.Instances
+			keywords.setdefault(row['SearchID'], []).append((row['Keywords'] or '').lower())
+			index['titles'][row['SearchID']] = row['Title']
+		for AutoID, values in keywords.items():
+			self._indexKeywords(index, AutoID, '\n'.join(values) if values else None)
+			if not values:
+				index['titles'].pop(AutoID, None)
+		index['version'] = (index['version'][0], index['version'][1] + 1)
+		return None
+		
+	def _getSearchRows(self, AutoIDs=None):
+		q = (Query().Select(['ask.SearchID', 'ask.Keywords', 'agi.Title'])
+					.From('dbo.vSearchKeywordsAsset', 'ask')
+					.Join('Asset.vAssetGalleryInstance', 'dbo.vSearchKeywordsAsset', 'agi', 'ask', 'agi.AutoID = ask.SearchID'))
+		if AutoIDs:
+			q.Where(['ask.SearchID IN ({0})'.format(', '.join('?' for AutoID in AutoIDs))])
+		return q.execute(AutoIDs if AutoIDs else [], dataBase=self.dataBase.Name)
+		
+	def _getNGrams(self, text):
+		n = self.NGRAM_LENGTH
+		return set(text[i:i + n] for i in range(len(text) - n + 1))
+		
+	def _indexKeywords(self, index, AutoID, text):
+		# Swap the keywords of AutoID (None removes them) in one assignment.
+		# Posting sets are replaced rather than changed so searches running at
+		# the same time keep a consistent set, new ones are added before the 
+		# swap and old ones removed after it.
+		old = index['keywords'].get(AutoID)
+		new = self._getNGrams(text) if text is not None else set()
+		ngrams = index['ngrams']
+		for ngram in new:
+			ngrams[ngram] = ngrams.get(ngram, set()) | set([AutoID])
+		if text is None:
+			index['keywords'].pop(AutoID, None)
+		else:
+			index['keywords'][AutoID] = text
+		if old is None:
+			return
+		for ngram in self._getNGrams(old) - new:
+			posting = ngrams.get(ngram, set()) - set([AutoID])
+			if posting:
+				ngrams[ngram] = posting
+			else:
+				ngrams.pop(ngram, None)
 		
 	def initializeInstances(self, AutoID):
 		vwc = component.ViewCanvas()
@@ -835,3 +1642,40 @@ class AssetExplorer(object):
 			inst.setPosition(obj.SUBVIEW_TOP, obj.SUBVIEW_LEFT)
 			vwc.addInstance(inst)
 		return vwc.Instances
+
+
+def benchmarkPowerTableRender(rowCount=500, columnCount=30):
+	""" Time PowerTable row and cell instance rendering on synthetic data. """
+	# Intended to be run from the gateway script console, no database needed.
+	dataTypes = ['FK', 
+				 enums.DataType.DATETIME.value, 
+				 enums.DataType.INT.value, 
+				 enums.DataType.VARCHAR.value]
+	columns = [{'name': 'b.[Column{0}]'.format(i),
+				'characterMax': 20 + i,
+				'dataType': dataTypes[i % len(dataTypes)],
+				'alias': 'Column{0}'.format(i),
+				'filter_': '',
+				'orderBy': '',
+				'referenceTable': '',
+				'isDisplayed': 1} 
+			   for i in range(columnCount)]
+	configs = {'columns': columns,
+			   'pager': {'rowsPerPage': rowCount, 'currentPage': 1},
+			   'tables': [{'name': 'dbo.Benchmark', 'alias': 'b', 'columnJoin': '', 'joinType': ''}]}
+	data = [[value for i in range(columnCount) for value in ('Value{0}'.format(i), row)] 
+			for row in range(rowCount)]
+	pt = PowerTable(db.DATABASE_DEFAULT, configs=configs)
+	
+	start = time.time()
+	rows = pt.getRowInstances(data)
+	rowTime = time.time() - start
+	start = time.time()
+	for row in rows:
+		pt.getCellInstances(row['row'])
+	cellTime = time.time() - start
+	return {'rows': rowCount,
+			'columns': columnCount,
+			'rowInstancesSeconds': rowTime,
+			'cellInstancesSeconds': cellTime,
+			'cellsPerSecond': rowCount*columnCount/cellTime if cellTime else None}
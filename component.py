@@ -41,8 +41,12 @@ class FLXRInstance(object):
 	@property
 	def Value(self):
 		# The IGN compatible structured dictionary to instantiate a 
-		# flex repeater instance with defined parameters.
-		instance = deepcopy(FLXRInstance.INSTANCE_TEMPLATE)
+		# flex repeater instance with defined parameters. Shallow copy of
+		# the template, only the nested dictionaries need new objects.
+		template = FLXRInstance.INSTANCE_TEMPLATE
+		instance = dict(template)
+		instance['instanceStyle'] = dict(template['instanceStyle'])
+		instance['instancePosition'] = dict(template['instancePosition'])
 		instance.update(self.parameters)
 		return instance
 
@@ -92,7 +96,10 @@ class VWCInstance(object):
 		return self.instance
 		
 	def _configureInstance(self):
-		inst = deepcopy(VWCInstance.INSTANCE_TEMPLATE)
+		# Shallow copy of the template, viewParams is replaced below so 
+		# style is the only nested dictionary needing a new object.
+		inst = dict(VWCInstance.INSTANCE_TEMPLATE)
+		inst['style'] = dict(VWCInstance.INSTANCE_TEMPLATE['style'])
 		inst['viewParams'] = self.parameters 
 		inst['viewPath'] = self.viewPath
 		return inst
@@ -113,6 +120,11 @@ class Dashboard(object):
   	COLUMN_COUNT_DEFAULT = 66
   	WIDGET_LENGTH_DEFAULT = 15
   	WIDGET_WIDTH_DEFAULT = 20
+	# Packed positions by (user, dashboard)
+	LAYOUT_CACHE = 'Dashboard.Layouts'
+	# Widget view parameter set once the widget has been in the viewport,
+	# widget views hold off their queries until it's true.
+	LOADED_PARAM = 'isLoaded'
   	
   	def __init__(self, rowCount=None, columnCount=None):
   		# Row and column count default to class defaults if unprovided
@@ -125,15 +137,84 @@ class Dashboard(object):
   	def clearGrid(self):
   		self.grid.clear()
   		
-  	def placeWidget(self, width=None, length=None):
-  		width = width if width else Dashboard.WIDGET_WIDTH_DEFAULT
-  		length = length if length else Dashboard.WIDGET_LENGTH_DEFAULT
-  		topLeftCorner = self.grid.placeRectangle(width, length)
-  		pos = {'rowStart': topLeftCorner[0] + 1, 'rowEnd': topLeftCorner[0] + width,
-  			   'columnStart': topLeftCorner[1] + 1, 'columnEnd': topLeftCorner[1] + length}
-  		self.widgets.append(DASHWidget(position=pos))
-  		
-  		
+	def placeWidget(self, width=None, length=None):
+		width = width if width else Dashboard.WIDGET_WIDTH_DEFAULT
+		length = length if length else Dashboard.WIDGET_LENGTH_DEFAULT
+		topLeftCorner = self.grid.placeRectangle(width, length)
+		if topLeftCorner is None:
+			return None
+		widget = DASHWidget(position=self._getPosFromCorner(topLeftCorner, width, length))
+		self.widgets.append(widget)
+		return widget
+		
+	def placeWidgets(self, sizes):
+		# Batch placement of [(width, length), ...], widgets that don't fit
+		# are skipped. Returns the placed widgets.
+		widgets = []
+		sizes = [(width if width else Dashboard.WIDGET_WIDTH_DEFAULT, 
+				  length if length else Dashboard.WIDGET_LENGTH_DEFAULT) for width, length in sizes]
+		for (width, length), corner in zip(sizes, self.grid.placeRectangles(sizes)):
+			if corner is not None:
+				widgets.append(DASHWidget(position=self._getPosFromCorner(corner, width, length)))
+		self.widgets.extend(widgets)
+		return widgets
+		
+	def getLayout(self, user, dashboard, sizes, firstRow=1, visibleRowCount=None):
+		# Widgets data for the sizes [(width, length), ...] packed in order. 
+		# The positions are cached by (user, dashboard) while the sizes and
+		# grid dimensions are unchanged. Widgets outside the visible rows 
+		# aren't loaded, see setVisibleRows().
+		sizes = [(width if width else Dashboard.WIDGET_WIDTH_DEFAULT, 
+				  length if length else Dashboard.WIDGET_LENGTH_DEFAULT) for width, length in sizes]
+		signature = (self.rowCount, self.columnCount, tuple(sizes))
+		layoutCache = cache.Cache(self.LAYOUT_CACHE, None)
+		entry = layoutCache.get((user, dashboard))
+		self.clearGrid()
+		self.widgets = []
+		if entry is None or entry['signature'] != signature:
+			positions = [self._getPosFromCorner(corner, width, length) if corner is not None else None
+						 for (width, length), corner in zip(sizes, self.grid.placeRectangles(sizes))]
+			entry = layoutCache.set((user, dashboard), {'signature': signature,
+														'positions': positions})
+		else:
+			# Grid is still marked so widgets can be added/removed afterwards.
+			for pos in entry['positions']:
+				if pos is not None:
+					self.addWidget(pos)
+		self.widgets = [DASHWidget(position=dict(pos)) for pos in entry['positions'] if pos is not None]
+		self.setVisibleRows(firstRow, visibleRowCount)
+		return [widget.data for widget in self.widgets]
+		
+	def invalidateLayout(self, user, dashboard):
+		cache.Cache(self.LAYOUT_CACHE, None).invalidate((user, dashboard))
+		
+	def getVisibleWidgets(self, firstRow, visibleRowCount=None):
+		# Indices of the widgets overlapping rows firstRow (1 based) to 
+		# firstRow + visibleRowCount, every widget if no count is given.
+		if visibleRowCount is None:
+			return list(range(len(self.widgets)))
+		lastRow = firstRow + visibleRowCount
+		return [i for i, widget in enumerate(self.widgets) 
+				if widget.data['position']['rowStart'] < lastRow and widget.data['position']['rowEnd'] > firstRow]
+		
+	def setVisibleRows(self, firstRow, visibleRowCount=None):
+		# Load the widgets in the viewport. A loaded widget stays loaded, 
+		# returns the indices of the widgets loaded by this call.
+		loaded = []
+		visible = set(self.getVisibleWidgets(firstRow, visibleRowCount))
+		for i, widget in enumerate(self.widgets):
+			params = widget.data['viewParams']
+			if i in visible and not params.get(self.LOADED_PARAM):
+				loaded.append(i)
+			params[self.LOADED_PARAM] = params.get(self.LOADED_PARAM, False) or i in visible
+		return loaded
+		
+	def _getPosFromCorner(self, topLeftCorner, width, length):
+		# Grid corners are 0 based, dashboard positions are 1 based with 
+		# exclusive ends.
+		return {'rowStart': topLeftCorner[0] + 1, 'rowEnd': topLeftCorner[0] + 1 + length,
+				'columnStart': topLeftCorner[1] + 1, 'columnEnd': topLeftCorner[1] + 1 + width}
+		
   	def addWidget(self, pos):
   		width, length = self._getDimensionsFromPos(pos)
   		self.grid.addRectangle(pos['rowStart'] - 1,
@@ -184,10 +265,26 @@ class DASHWidget(object):
 		return data
 		
 	def setPosition(self, rowStart, rowEnd, columnStart, columnEnd):
-		pass
+		self.data['position'] = {'rowStart': rowStart,
+								 'rowEnd': rowEnd,
+								 'columnStart': columnStart,
+								 'columnEnd': columnEnd}
 
 class Dropdown(object):
 	""" Dropdown component object. """
+	
+	# Primary ID options shared by every cell and session, keyed by 
+	# (database, table). Tables above the row threshold aren't cached and
+	# are searched a page at a time instead.
+	OPTION_CACHE = 'Dropdown.PrimaryIDOptions'
+	OPTION_TTL = 600
+	OPTION_ROW_THRESHOLD = 2000
+	SEARCH_PAGE_SIZE = 50
+	# AutoID and primary ID column headers by (database, table), read from 
+	# the bulk column metadata rather than the per column Table properties.
+	HEADER_CACHE = 'Dropdown.IDColumnHeaders'
+	HEADER_TTL = 600
+	
 	def __init__(self):
 		self.value = None
 		self.options = []
@@ -195,8 +292,13 @@ class Dropdown(object):
 	def getPrimaryIDOptions(self, table):
 		# Query to retrieve a pyDataSet containing the AutoID with their 
 		# corresponding primary ID's
-		q = (Query().Select(['{0} AS AutoID'.format(table.AutoIDColumnHeader), 
-							 '{0} AS ID'.format(table.PrimaryIDColumnHeader)])
+		headers = self._getIDColumnHeaders(table)
+		# Expecting tuple but catches val.Error types.
+		if isinstance(headers, Error):
+			return headers.Value
+		autoIDColumn, primaryIDColumn = headers
+		q = (Query().Select(['{0} AS AutoID'.format(autoIDColumn), 
+							 '{0} AS ID'.format(primaryIDColumn)])
 					.From(table.FullName))
 		data = q.execute(dataBase=table.dataBase.Name)
 		# Expecting PyDataset but catches val.Error types.
@@ -205,6 +307,117 @@ class Dropdown(object):
 		self.options = [DDLOption(row['AutoID'], row['ID']).Value for row in data]
 		return self.options
 		
+	def getSharedPrimaryIDOptions(self, table, search='', page=1):
+		# Primary ID options from the gateway cache, built once per table. 
+		# The search term filters them (case insensitive), for large tables 
+		# a page of matching options is queried instead.
+		entry = self._getOptionCacheEntry(table)
+		# Expecting dictionary but catches val.Error types.
+		if isinstance(entry, Error):
+			return entry.Value
+		if entry['isLarge']:
+			return self.searchPrimaryIDOptions(table, search, page)
+		if search:
+			search = unicode(search).lower()
+			self.options = [option for option in entry['options'] 
+							if search in unicode(option['label']).lower()]
+		else:
+			self.options = list(entry['options'])
+		return self.options
+		
+	def searchPrimaryIDOptions(self, table, search='', page=1):
+		# Search-as-you-type mode for large tables, one page of options whose
+		# primary ID contains the search term.
+		headers = self._getIDColumnHeaders(table)
+		# Expecting tuple but catches val.Error types.
+		if isinstance(headers, Error):
+			return headers.Value
+		autoIDColumn, primaryIDColumn = headers
+		q = (Query().Select(['{0} AS AutoID'.format(autoIDColumn), 
+							 '{0} AS ID'.format(primaryIDColumn)])
+					.From(table.FullName))
+		args = []
+		if search:
+			q.Where(['{0} LIKE ?'.format(primaryIDColumn)])
+			args.append('%{0}%'.format(search))
+		q.paginate([primaryIDColumn], self.SEARCH_PAGE_SIZE, page)
+		data = q.execute(args, dataBase=table.dataBase.Name)
+		# Expecting PyDataset but catches val.Error types.
+		if isinstance(data, Error):
+			return data.Value
+		self.options = [DDLOption(row['AutoID'], row['ID']).Value for row in data]
+		return self.options
+		
+	def refreshOptions(self, table, autoIDs):
+		# Incrementally refresh the cached options of rows that were created,
+		# updated or deleted instead of rebuilding the table's options.
+		optionCache = cache.Cache(self.OPTION_CACHE, self.OPTION_TTL)
+		key = (table.dataBase.Name, table.FullName)
+		entry = optionCache.get(key)
+		autoIDs = list(autoIDs)
+		if entry is None or entry['isLarge'] or not autoIDs:
+			return None
+		# Rebuild from scratch next time if the refresh fails.
+		headers = self._getIDColumnHeaders(table)
+		if isinstance(headers, Error):
+			optionCache.invalidate(key)
+			return headers.Value
+		autoIDColumn, primaryIDColumn = headers
+		q = (Query().Select(['{0} AS AutoID'.format(autoIDColumn), 
+							 '{0} AS ID'.format(primaryIDColumn)])
+					.From(table.FullName)
+					.Where(['{0} IN ({1})'.format(autoIDColumn, 
+												  ', '.join('?' for autoID in autoIDs))]))
+		data = q.execute(autoIDs, dataBase=table.dataBase.Name)
+		if isinstance(data, Error):
+			optionCache.invalidate(key)
+			return data.Value
+		refreshed = {row['AutoID']: DDLOption(row['AutoID'], row['ID']).Value for row in data}
+		# Replace updated options, drop deleted ones and append new ones. A new
+		# list is cached so sessions reading the current one aren't disturbed.
+		options = [refreshed.pop(option['value'], option) for option in entry['options']
+				   if option['value'] not in autoIDs or option['value'] in refreshed]
+		options.extend(refreshed.values())
+		optionCache.set(key, {'isLarge': False, 'options': options}, [key])
+		return None
+		
+	def _getIDColumnHeaders(self, table):
+		# Bracketed (AutoID, primary ID) column headers of table, one metadata
+		# query per (database, table) while cached.
+		headerCache = cache.Cache(self.HEADER_CACHE, self.HEADER_TTL)
+		key = (table.dataBase.Name, table.FullName)
+		headers = headerCache.get(key)
+		if headers is not None:
+			return headers
+		metadata = table.getColumnMetadata()
+		# Expecting list but catches val.Error types, not cached.
+		if isinstance(metadata, Error):
+			return metadata
+		autoIDColumn = next((col['name'] for col in metadata if col['isAutoID']), None)
+		primaryIDColumn = next((col['name'] for col in metadata if col['isPrimaryID']), None)
+		if autoIDColumn is None or primaryIDColumn is None:
+			return Error(enums.Message.HANDLED_FAILURE.value, 
+						 'Table {0} needs AutoID and primary ID columns.'.format(table.FullName))
+		return headerCache.set(key, ('[{0}]'.format(autoIDColumn), '[{0}]'.format(primaryIDColumn)), [key])
+		
+	def _getOptionCacheEntry(self, table):
+		optionCache = cache.Cache(self.OPTION_CACHE, self.OPTION_TTL)
+		key = (table.dataBase.Name, table.FullName)
+		entry = optionCache.get(key)
+		if entry is not None:
+			return entry
+		rowCount = table.getRowCount()
+		# Expecting integer but catches val.Error values.
+		if not isinstance(rowCount, (int, long)):
+			return Error(enums.Message.UNHANDLED_FAILURE.value, rowCount)
+		if rowCount > self.OPTION_ROW_THRESHOLD:
+			return optionCache.set(key, {'isLarge': True, 'options': []}, [key])
+		options = Dropdown().getPrimaryIDOptions(table)
+		# Expecting list but catches val.Error values.
+		if isinstance(options, dict):
+			return Error(enums.Message.UNHANDLED_FAILURE.value, options)
+		return optionCache.set(key, {'isLarge': False, 'options': options}, [key])
+		
 	def addOption(self, value, label):
 		self.option.append(DDLOption(value, label).Value)
 		return self.options
@@ -231,20 +444,63 @@ class DDLOption(object):
 class Tree(object):
 	""" Tree component object. """
 		
-	def __init__(self, items=None):
+	def __init__(self, items=None, expandedPaths=None):
 		# Items property is all I'm concerned with right now.
 		self.items = items if items else []
+		# Cache, {path: item} and {label: [path, ...]} indices built on the
+		# first lookup and reset when items shift.
+		self._index = None
+		self._labelIndex = None
+		# Cache, set of expanded paths. Pass the ExpandedPaths of a previous 
+		# Tree to skip finding them in the items.
+		self._expanded = set(expandedPaths) if expandedPaths is not None else None
+		
+	@property
+	def Items(self):
+		# The IGN compatible items property.
+		return self.items
+		
+	def getItem(self, path):
+		# Item at an index path ie '0/3/1', None if there isn't one.
+		return self._getIndex().get(path)
+		
+	def getPathsFromLabel(self, label):
+		# Paths of every item with the label.
+		self._getIndex()
+		return list(self._labelIndex.get(label, []))
 		
 	def addItem(self, label, path, expanded=False, data=None, items=None, icon=None):
 		# Add item to items and return the new items list
 		newItem = TreeItem(label, path, expanded, data, items, icon).Value
 		parentItem, index = self._getParentItem(path)
 		parentItem.insert(index, newItem)
+		# Appending doesn't shift any paths so the index can just be extended.
+		if self._index is not None and index >= len(parentItem) - 1:
+			parentPath = path.rpartition('/')[0]
+			self._indexItems(parentItem, parentPath, len(parentItem) - 1)
+		else:
+			self._resetIndex()
+		return self.items
+		
+	def addItems(self, records, icon=None):
+		# Bulk add [(path, label, data), ...] in one pass and return the new
+		# items list. Parents are added before children and siblings in index
+		# order so every path exists by the time it's inserted at.
+		ordered = sorted(records, key=lambda record: self._getIndices(record[0]))
+		# Inserts shift the indexed paths of their later siblings, so parents
+		# are walked to rather than looked up in an index built before them.
+		self._resetIndex()
+		for path, label, data in ordered:
+			newItem = TreeItem(label, path, data=data, icon=icon).Value
+			parentItem, index = self._getParentItem(path)
+			parentItem.insert(index, newItem)
+		self._resetIndex()
 		return self.items
 
 	def removeItem(self, path):
 		# Remove item and returns deleted item
 		parentItem, index = self._getParentItem(path)
+		self._resetIndex()
 		return parentItem.pop(index)
 		
 	def replaceItem(self, label, path, expanded=False, data=None, items=None, icon=None):
@@ -252,6 +508,7 @@ class Tree(object):
 		newItem = TreeItem(label, path, expanded, data, items, icon).Value
 		parentItem, index = self._getParentItem(path)
 		parentItem[index] = newItem
+		self._resetIndex()
 		return self.items
 		
 	def moveItem(self, currentPath, desPath):
@@ -262,6 +519,10 @@ class Tree(object):
 							item['items'], item['icon'])
 		
 	def _getParentItem(self, path):
+		# Parent looked up in the index when it's current, otherwise walked.
+		parentPath, _, index = path.rpartition('/')
+		if self._index is not None and parentPath in self._index:
+			return self._index[parentPath]['items'], int(index)
 		indices = self._getIndices(path)
 		if len(indices) == 1:
 			return self.items, indices[0]
@@ -273,6 +534,27 @@ class Tree(object):
 	def _getIndices(self, path):
 		return list(map(int, path.split('/')))
 		
+	def _getIndex(self):
+		if self._index is None:
+			self._index = {}
+			self._labelIndex = {}
+			self._indexItems(self.items, '')
+		return self._index
+		
+	def _indexItems(self, items, parentPath, start=0):
+		# Index items (and their children) from start onwards.
+		for i in range(start, len(items)):
+			item = items[i]
+			path = '{0}/{1}'.format(parentPath, i) if parentPath else str(i)
+			self._index[path] = item
+			self._labelIndex.setdefault(item['label'], []).append(path)
+			if item.get('items'):
+				self._indexItems(item['items'], path)
+				
+	def _resetIndex(self):
+		self._index = None
+		self._labelIndex = None
+		
 	def getReadablePath(self, path):
 		# Iterate through items and construct a readable path
 		# ie '0/0/1' might translate to 'Categories/Asset/Basic Asset'
@@ -289,20 +571,61 @@ class Tree(object):
 		
 	def openItemPath(self, path):
 		# Changes the item parameter 'expanded' to true for each
-		# item along the 'path' except the item itself.
-		# First collapse all items.
-		self.setItemsCollapsed()
-		indices = self._getIndices(path)
-		if len(indices) == 1:
-			self.items[indices[0]]['expanded'] = True
-			return self.items
-		item = self.items[indices[0]]
-		item['expanded'] = True
-		for index in indices[1:]:
-			item = item['items'][index]
-			item['expanded'] = True
+		# item along the 'path', every other item is collapsed.
+		self.getOpenItemPatch(path)
 		return self.items
 		
+	def getOpenItemPatch(self, path):
+		# Same as openItemPath() but only the items whose state flips are
+		# changed, returns those changes {path: expanded} for applyPatch().
+		indices = self._getIndices(path)
+		target = set('/'.join(map(str, indices[:i])) for i in range(1, len(indices) + 1))
+		expanded = self.ExpandedPaths
+		patch = dict((p, False) for p in expanded - target)
+		patch.update((p, True) for p in target - expanded)
+		self.applyPatch(patch)
+		return patch
+		
+	def applyPatch(self, patch, items=None):
+		# Set 'expanded' on only the patched paths. Items defaults to this tree,
+		# pass a session's tree items property to update just those nodes there.
+		items = items if items is not None else self.items
+		for path in sorted(patch, key=self._getIndices):
+			item = self._walkPath(items, path)
+			if item is not None:
+				item['expanded'] = patch[path]
+		if items is self.items and self._expanded is not None:
+			self._expanded.difference_update(p for p, val in patch.items() if not val)
+			self._expanded.update(p for p, val in patch.items() if val)
+		
+	@property
+	def ExpandedPaths(self):
+		# Every expanded item, including those under collapsed items, so 
+		# opening a path collapses everything else like a full reset. Found
+		# with one walk of the tree, pass them to Tree() to skip it.
+		if self._expanded is None:
+			self._expanded = set()
+			self._findExpanded(self.items, '')
+		return set(self._expanded)
+		
+	def _findExpanded(self, items, parentPath):
+		for i, item in enumerate(items):
+			path = '{0}/{1}'.format(parentPath, i) if parentPath else str(i)
+			if item.get('expanded'):
+				self._expanded.add(path)
+			if item.get('items'):
+				self._findExpanded(item['items'], path)
+		
+	def _walkPath(self, items, path):
+		# Item at path found through its indices only, None if it's missing.
+		item = None
+		for index in self._getIndices(path):
+			if index >= len(items):
+				return None
+			item = items[index]
+			items = item['items'] if 'items' in item else []
+		return item
+		
 	def _collapseItems(self, items):	
 		for item in items:
 			item['expanded'] = False
@@ -311,7 +634,9 @@ class Tree(object):
 		return items
 		
 	def setItemsCollapsed(self):
+		# Full reset, every item is visited.
 		self.items = self._collapseItems(self.items)
+		self._expanded = set()
 		return self.items
 		
 	def getNumSiblings(self, path):
@@ -344,7 +669,8 @@ class TreeItem(object):
 		
 	@property
 	def Value(self):
-		val = deepcopy(self.ITEM_TEMPLATE)
+		# Every template key is set below so a shallow copy is enough.
+		val = dict(self.ITEM_TEMPLATE)
 		val['label'] = self.label
 		val['expanded'] = self.expanded
 		val['data'] = self.data
@@ -370,7 +696,8 @@ class Icon(object):
 		
 	@property
 	def Value(self):
-		val = deepcopy(self.ICON_TEMPLATE)
+		# Every template key is set below so a shallow copy is enough.
+		val = dict(self.ICON_TEMPLATE)
 		val['path'] = self.path
 		val['color'] = self.color
 		val['style'] = self.style
@@ -149,6 +149,62 @@ class Table(object):
 		return {row['ExtendedPropertyName']: row['ExtendedPropertyValue'] 
 				for row in data}
 	
+	def getColumnMetadata(self):
+		# Single query for the metadata of every column (data type, character
+		# max, nullability, AutoID/PrimaryID extended properties and FK 
+		# referenced table) rather than the per column queries made by the
+		# Column object.
+		q = (Query().Select(['isc.COLUMN_NAME AS [Column]', 
+							 'isc.DATA_TYPE AS [DataType]',
+							 'isc.CHARACTER_MAXIMUM_LENGTH AS [CharacterMax]',
+							 'isc.IS_NULLABLE AS [IsNullable]',
+							 'rs.[name] AS [ReferencedSchema]',
+							 'rt.[name] AS [ReferencedTable]',
+							 '''CASE WHEN EXISTS (SELECT 1 FROM dbo.vColumnExtendedProperties AS ep
+										WHERE ep.TableSchema = isc.TABLE_SCHEMA AND ep.TableName = isc.TABLE_NAME 
+										AND ep.ColumnName = isc.COLUMN_NAME AND ep.ExtendedPropertyName = ?) 
+								THEN 1 ELSE 0 END AS [IsAutoID]''',
+							 '''CASE WHEN EXISTS (SELECT 1 FROM dbo.vColumnExtendedProperties AS ep
+										WHERE ep.TableSchema = isc.TABLE_SCHEMA AND ep.TableName = isc.TABLE_NAME 
+										AND ep.ColumnName = isc.COLUMN_NAME AND ep.ExtendedPropertyName = ?) 
+								THEN 1 ELSE 0 END AS [IsPrimaryID]'''])
+					.From('INFORMATION_SCHEMA.COLUMNS', 'isc')
+					.Join('sys.columns', 'INFORMATION_SCHEMA.COLUMNS', 'pc', 'isc', 
+						  "pc.object_id = OBJECT_ID(QUOTENAME(isc.TABLE_SCHEMA) + '.' + QUOTENAME(isc.TABLE_NAME)) AND pc.[name] = isc.COLUMN_NAME",
+						  enums.JoinType.left.value)
+					.Join('sys.foreign_key_columns', 'sys.columns', 'fkc', 'pc', 
+						  'fkc.parent_object_id = pc.object_id AND fkc.parent_column_id = pc.column_id',
+						  enums.JoinType.left.value)
+					.Join('sys.tables', 'sys.foreign_key_columns', 'rt', 'fkc', 
+						  'rt.object_id = fkc.referenced_object_id', 
+						  enums.JoinType.left.value)
+					.Join('sys.schemas', 'sys.tables', 'rs', 'rt', 
+						  'rs.schema_id = rt.schema_id', 
+						  enums.JoinType.left.value)
+					.Where(['isc.TABLE_SCHEMA = ?', 'isc.TABLE_NAME = ?'])
+					.OrderBy(['isc.ORDINAL_POSITION']))
+		data = q.execute([enums.ExtProps.IsAutoID.value, enums.ExtProps.IsPrimaryID.value,
+						  self.schema.Name, self.Name], 
+						 dataBase=self.dataBase.Name)
+		# Expecting PyDataset but catches Error type.
+		if isinstance(data, Error):
+			return data
+		metadata = []
+		for row in data:
+			# Composite FKs can repeat a column, keep the first.
+			if row['Column'] in [col['name'] for col in metadata]:
+				continue
+			characterMax = row['CharacterMax']
+			metadata.append({'name': row['Column'],
+							 'dataType': row['DataType'],
+							 'characterMax': Column.DEFAULT_CHARACTER_MAX if characterMax == -1 else characterMax,
+							 'isNonNull': row['IsNullable'] != 'YES',
+							 'isAutoID': bool(row['IsAutoID']),
+							 'isPrimaryID': bool(row['IsPrimaryID']),
+							 'referenceTable': ('{0}.{1}'.format(row['ReferencedSchema'], row['ReferencedTable'])
+							 					if row['ReferencedTable'] else None)})
+		return metadata
+	
 	def getAllRows(self):
 		# Query to return all rows and all columns from the table.
 		q = Query().Select().From(self.FullName)
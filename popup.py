@@ -38,6 +38,8 @@ class AssetTypePopup(object):
 				payload = {'error': result.Value}
 				system.perspective.sendMessage('{0}RaiseError'.format(self._table.Name), payload)
 			else:
+				# Keep shared FK dropdown options referencing this table current.
+				component.Dropdown().refreshOptions(self._table, [self._row.AutoID])
 				# Send message that changes were made
 				payload = {'AssetTypeAutoID': self._row.AutoID}
 				system.perspective.sendMessage('{0}ChangesSaved'.format(self._table.Name), payload)
@@ -49,6 +51,7 @@ class AssetTypePopup(object):
 				payload = {'error': result.Value}
 				system.perspective.sendMessage('{0}RaiseError'.format(self._table.Name), payload)
 			else:
+				component.Dropdown().refreshOptions(self._table, [result])
 				# Send message that changes were saved
 				payload = {'AssetTypeAutoID': result}
 				system.perspective.sendMessage('{0}ChangesSaved'.format(self._table.Name), payload)
@@ -1,5 +1,9 @@
 # Explicit dependencies
 import enums
+import cache
+import threading
+import time
+from Queue import Queue, Empty
 from val import Error
 
 
@@ -352,6 +356,26 @@ class Union(object):
 class Query(object):
 	""" Query master class object. """
 	
+	# Seconds between checks of the token/timeout while a query runs.
+	WAIT_INTERVAL = 0.05
+	# Opt-in read results by (database, query, args), tagged with the tables
+	# read and evicted by writes executed through Query.
+	RESULT_CACHE = 'Query.Results'
+	RESULT_TTL = 60
+	RESULT_CACHE_SIZE = 500
+	# Write count by (database, table), a read whose tables were written 
+	# while it ran doesn't cache its (possibly stale) result.
+	GENERATION_CACHE = 'Query.TableGenerations'
+	# Reads running right now by (database, query, args), identical reads
+	# started meanwhile wait for and share their result. Tagged with the 
+	# tables read so a write detaches them, later reads don't join a read
+	# that may predate the write.
+	IN_FLIGHT_CACHE = 'Query.InFlight'
+	# Worker threads running executeAsync() queries, the others wait queued.
+	# Idle workers exit after ASYNC_IDLE_TIMEOUT seconds.
+	ASYNC_LIMIT = 8
+	ASYNC_IDLE_TIMEOUT = 60
+	
 	def __init__(self):
 		# Statement objects (ordered)
 		self._statementObjs = []
@@ -440,7 +464,7 @@ class Query(object):
 		self.Fetch(rowsPerPage)
 		return self
 	
-	def execute(self, args=[], dataBase='PRT_DB', NamedQuery=False):
+	def execute(self, args=[], dataBase='PRT_DB', NamedQuery=False, token=None, timeout=None, useCache=False):
 		# @@NEEDS_BUSINESS_LOGIC@@
 		# NOT DONE
 		# Validating after all the statement object methods have been 
@@ -448,7 +472,123 @@ class Query(object):
 		self._error = self._validate()
 		if isinstance(self._error, Error):
 			return self._error
+		if self._isWrite():
+			result = self._run(args, dataBase, NamedQuery, token, timeout)
+			# Errors included, a failed statement may still have changed rows.
+			tag = self._getTableTag(dataBase, self.BaseStatement.table)
+			cache.Cache(self.GENERATION_CACHE, None).increment(tag)
+			cache.Cache(self.IN_FLIGHT_CACHE, None).invalidateTag(tag)
+			self.invalidateResults(dataBase, tag[1])
+			return result
+		if not useCache:
+			return self._runShared(args, dataBase, NamedQuery, token, timeout)
+		resultCache = cache.Cache(self.RESULT_CACHE, self.RESULT_TTL, self.RESULT_CACHE_SIZE)
+		key = (dataBase, self.Query, tuple(args), NamedQuery)
+		result = resultCache.get(key)
+		if result is None:
+			tags = self._getTableTags(dataBase)
+			generations = self._getGenerations(tags)
+			result = self._runShared(args, dataBase, NamedQuery, token, timeout)
+			if not isinstance(result, Error) and self._getGenerations(tags) == generations:
+				resultCache.set(key, result, tags)
+		return result
+		
+	def executeAsync(self, args=[], dataBase='PRT_DB', NamedQuery=False, timeout=None, useCache=False):
+		# Queue the query on the worker pool and return a QueryFuture, see 
+		# gather() to wait on several. The timeout (seconds) is counted from
+		# now and applies when waiting on the result.
+		future = QueryFuture(timeout)
+		_submitAsync((self, args, dataBase, NamedQuery, useCache, future))
+		return future
+	
+	def _runShared(self, args, dataBase, NamedQuery, token, timeout):
+		# Single flight, the first caller runs the read and identical callers
+		# arriving before it finishes wait for its result. Reads with a token
+		# or timeout are session specific so they always run on their own.
+		if token is not None or timeout is not None:
+			return self._run(args, dataBase, NamedQuery, token, timeout)
+		key = (dataBase, self.Query, tuple(args), NamedQuery)
+		flights = cache.Cache(self.IN_FLIGHT_CACHE, None)
+		flight = {'event': threading.Event(), 'result': []}
+		current = flights.setDefault(key, flight, self._getTableTags(dataBase))
+		if current is not flight:
+			current['event'].wait()
+			if current['result']:
+				return current['result'][0]
+			return Error(enums.Message.UNHANDLED_FAILURE.value, 
+						 'Shared query "{0}" against {1} failed.'.format(self.insertArgsIntoQuery(args), dataBase))
+		try:
+			result = self._run(args, dataBase, NamedQuery, token, timeout)
+			flight['result'].append(result)
+		finally:
+			# Later callers start a new flight (the result may be stale by then).
+			# Unless a write detached it and a later read started its own.
+			flights.invalidateValue(key, flight)
+			flight['event'].set()
+		return result
+		
+	@property
+	def ResultCacheStats(self):
+		return cache.Cache(self.RESULT_CACHE, self.RESULT_TTL, self.RESULT_CACHE_SIZE).Stats
+		
+	def invalidateResults(self, dataBase, table):
+		# Evict the cached results reading table (full name) on dataBase.
+		return cache.Cache(self.RESULT_CACHE, self.RESULT_TTL, self.RESULT_CACHE_SIZE).invalidateTag((dataBase, table.lower()))
 		
+	def _isWrite(self):
+		return isinstance(self.BaseStatement, (Update, Delete, Insert))
+		
+	def _getTableTags(self, dataBase):
+		tags = set()
+		for obj in self._statementObjs:
+			if isinstance(obj, From):
+				tags.add(self._getTableTag(dataBase, obj.table))
+			elif isinstance(obj, Join):
+				tags.add(self._getTableTag(dataBase, obj.childTable))
+				tags.add(self._getTableTag(dataBase, obj.parentTable))
+		return tags
+		
+	def _getTableTag(self, dataBase, table):
+		# Tables given without a schema (ie a Join's default parent table) 
+		# have no FullName, they resolve to the default schema.
+		if hasattr(table, 'schema'):
+			return (dataBase, table.FullName.lower())
+		return (dataBase, '[{0}].[{1}]'.format(db.SCHEMA_DEFAULT, table.Name).lower())
+		
+	def _getGenerations(self, tags):
+		generations = cache.Cache(self.GENERATION_CACHE, None)
+		return dict((tag, generations.get(tag, 0)) for tag in tags)
+		
+	def _run(self, args, dataBase, NamedQuery, token, timeout):
+		if token is None and timeout is None:
+			return self._execute(args, dataBase, NamedQuery)
+		
+		# A cancelled query isn't started. Once started it's waited on from 
+		# another thread and its result dropped if it's cancelled or takes
+		# longer than timeout seconds.
+		if token is not None and token.IsCancelled:
+			return self._getCancelledError(args, dataBase)
+		result = []
+		worker = threading.Thread(target=lambda: result.append(self._execute(args, dataBase, NamedQuery)))
+		worker.setDaemon(True)
+		worker.start()
+		deadline = time.time() + timeout if timeout else None
+		while worker.isAlive():
+			if token is not None and token.IsCancelled:
+				return self._getCancelledError(args, dataBase)
+			if deadline is not None and time.time() >= deadline:
+				return Error(enums.Message.HANDLED_FAILURE.value, 
+							 'Query "{0}" against {1} timed out after {2} seconds.'.format(self.insertArgsIntoQuery(args), dataBase, timeout))
+			worker.join(self.WAIT_INTERVAL)
+		if token is not None and token.IsCancelled:
+			return self._getCancelledError(args, dataBase)
+		return result[0]
+		
+	def _getCancelledError(self, args, dataBase):
+		return Error(enums.Message.HANDLED_FAILURE.value, 
+					 'Query "{0}" against {1} was cancelled.'.format(self.insertArgsIntoQuery(args), dataBase))
+	
+	def _execute(self, args, dataBase, NamedQuery):
 		# Unhandled failure handling.	
 		try:
 			if NamedQuery:
@@ -476,3 +616,165 @@ class Query(object):
 		for arg in args:
 			q = q.replace('?', "'{0}'".format(str(arg)), 1)
 		return q
+
+
+class CancellationToken(object):
+	""" Query cancellation token object. """
+	
+	def __init__(self, event=None):
+		# Wraps a threading.Event so the token can be shared across threads 
+		# (and kept in the gateway cache).
+		self._event = event if event is not None else threading.Event()
+		
+	@property
+	def IsCancelled(self):
+		return self._event.isSet()
+		
+	def cancel(self):
+		self._event.set()
+		
+	def wait(self, timeout):
+		# Wait up to timeout seconds for a cancellation, True if cancelled.
+		self._event.wait(timeout)
+		return self.IsCancelled
+		
+		
+class LatestWins(object):
+	""" Per session "latest wins" query coordinator object. """
+	
+	# Current token event by (sessionID, channel), bounded as ended sessions
+	# never replace theirs. An evicted token only means its query isn't
+	# cancelled by the next one.
+	TOKEN_CACHE = 'Query.LatestWins'
+	TOKEN_TTL = 600
+	TOKEN_CACHE_SIZE = 1000
+	# Seconds a query waits to be superseded before it's issued, so a burst
+	# of keystrokes only queries the last one.
+	DEBOUNCE = 0.15
+	
+	def __init__(self, sessionID, channel, debounce=DEBOUNCE):
+		# Channel names the component instance the queries come from, ie 
+		# 'SearchTextField.<view path>/<component path>'
+		self.key = (sessionID, channel)
+		self.debounce = debounce
+		
+	def begin(self):
+		# Cancel the session's previous query on the channel and return the
+		# token for the new one.
+		token = CancellationToken()
+		tokenCache = cache.Cache(self.TOKEN_CACHE, self.TOKEN_TTL, self.TOKEN_CACHE_SIZE)
+		previous = tokenCache.get(self.key)
+		if previous is not None:
+			previous.set()
+		tokenCache.set(self.key, token._event)
+		return token
+		
+	def execute(self, query, args=[], dataBase='PRT_DB', timeout=None):
+		# Execute query as the latest on the channel, superseding the others.
+		# A query superseded during the debounce isn't issued, execute() 
+		# returns its cancelled Error.
+		token = self.begin()
+		if self.debounce:
+			token.wait(self.debounce)
+		return query.execute(args, dataBase, token=token, timeout=timeout)
+		
+		
+class QueryFuture(object):
+	""" Pending executeAsync() result object. """
+	
+	def __init__(self, timeout=None):
+		self.token = CancellationToken()
+		self.deadline = time.time() + timeout if timeout else None
+		self._event = threading.Event()
+		self._result = None
+		
+	@property
+	def IsDone(self):
+		return self._event.isSet()
+		
+	def cancel(self):
+		# A query that hasn't started yet won't be run.
+		self.token.cancel()
+		
+	def result(self, timeout=None):
+		# Wait for the result (or val.Error) up to timeout seconds or the 
+		# future's deadline, whichever comes first. A query that runs out of
+		# time is cancelled and a handled val.Error returned.
+		deadlines = [deadline for deadline in (self.deadline, time.time() + timeout if timeout else None) 
+					 if deadline is not None]
+		if deadlines:
+			self._event.wait(max(0, min(deadlines) - time.time()))
+		else:
+			self._event.wait()
+		if not self._event.isSet():
+			self.cancel()
+			return Error(enums.Message.HANDLED_FAILURE.value, 'Query timed out.')
+		return self._result
+		
+	def _setResult(self, result):
+		self._result = result
+		self._event.set()
+		
+		
+# executeAsync() worker pool, at most ASYNC_LIMIT threads taking jobs from the
+# queue. Kept by the module (not the gateway cache) so a script reload starts a
+# new pool with the current ASYNC_LIMIT, the old workers finish their queue and
+# exit once idle.
+_ASYNC_QUEUE = Queue()
+_ASYNC_WORKERS = []
+_ASYNC_LOCK = threading.Lock()
+
+
+def _submitAsync(job):
+	# Workers are started as jobs arrive, up to the limit.
+	with _ASYNC_LOCK:
+		_ASYNC_QUEUE.put(job)
+		if len(_ASYNC_WORKERS) < Query.ASYNC_LIMIT:
+			worker = threading.Thread(target=_runWorker, 
+									  name='Query.executeAsync-{0}'.format(len(_ASYNC_WORKERS)))
+			worker.setDaemon(True)
+			_ASYNC_WORKERS.append(worker)
+			worker.start()
+			
+			
+def _runWorker():
+	# Worker loop, exits after ASYNC_IDLE_TIMEOUT seconds without a job. The
+	# queue is checked under the lock so a job submitted meanwhile isn't left
+	# without a worker.
+	while True:
+		try:
+			job = _ASYNC_QUEUE.get(True, Query.ASYNC_IDLE_TIMEOUT)
+		except Empty:
+			with _ASYNC_LOCK:
+				if _ASYNC_QUEUE.empty():
+					_ASYNC_WORKERS.remove(threading.currentThread())
+					return
+			continue
+		try:
+			_runAsync(*job)
+		except:
+			# Java throwables included, the future has its result already.
+			pass
+
+
+def _runAsync(query, args, dataBase, NamedQuery, useCache, future):
+	# Run an executeAsync() query, errors are captured as val.Error results.
+	result = Error(enums.Message.UNHANDLED_FAILURE.value, 
+				   'Async query against {0} failed.'.format(dataBase))
+	try:
+		if future.token.IsCancelled:
+			result = query._getCancelledError(args, dataBase)
+		else:
+			result = query.execute(args, dataBase, NamedQuery, useCache=useCache)
+	except Exception as e:
+		result = Error(enums.Message.UNHANDLED_FAILURE.value, str(e))
+	finally:
+		# Always set, gather() without a timeout would wait on it forever.
+		future._setResult(result)
+		
+		
+def gather(futures, timeout=None):
+	""" Results (or val.Errors) of QueryFutures in order, waiting up to timeout seconds overall. """
+	deadline = time.time() + timeout if timeout else None
+	return [future.result(max(0.001, deadline - time.time()) if deadline else None) 
+			for future in futures]
@@ -1,6 +1,14 @@
 import socket
+import hashlib
+import time
+from itertools import islice
 from db import Database
 
+# Kinds of difference records yielded by iterDiff()
+DIFF_KEYS = 'keys'
+DIFF_LENGTH = 'length'
+DIFF_VALUE = 'value'
+
 def datasetToDict(dataset):
 	"""
 	| Converts dataset to dictionary
@@ -38,47 +46,198 @@ def isNullValue(value):
    
 def areEqualDicts(d1, d2):
 	""" Compare if two dictionaries are equivalent. """
-	return not(bool(deepDiff(d1, d2)))
+	return isEqual(d1, d2)
+	
+def isEqual(d1, d2):
+	""" Deep comparison that stops at the first difference found. """
+	for record in iterDiff(d1, d2):
+		return False
+	return True
+	
+def getDiff(d1, d2, limit=None):
+	"""
+	| Structured differences between two nested dictionaries/lists.
+	| Parameters: d1, d2, limit number of differences returned (int)
+	| Returns: [(path, kind, old, new), ...] (list)
+	"""
+	if limit is None:
+		return list(iterDiff(d1, d2))
+	return list(islice(iterDiff(d1, d2), limit))
 
-def deepDiff(d1, d2, differences=None, level='root'):
-	""" Recursive algorithim to compare two dictionaries and their contents. """
-	# Initializing differences dictionary for first level of recursion.
-	differences = differences if differences else {}
-	# If current layer is dictionary, check if keys are equal
+def iterDiff(d1, d2, path=None):
+	"""
+	| Lazily yields difference records (path, kind, old, new). Nothing is 
+	| formatted here, see renderDiffRecord().
+	| DIFF_KEYS: old/new are the keys only in d1/d2
+	| DIFF_LENGTH: old/new are the list lengths
+	| DIFF_VALUE: old/new are the values
+	"""
+	# Path is one list appended and popped while walking, only copied to
+	# a tuple when a difference is yielded.
+	path = path if path is not None else []
 	if isinstance(d1, dict) and isinstance(d2, dict):
-		# If keys aren't equal store them sets to find the difference between them
-		if d1.keys() != d2.keys():
+		if len(d1) != len(d2) or any(key not in d2 for key in d1):
 			s1 = set(d1.keys())
 			s2 = set(d2.keys())
-			# Append the level as a key if differences dict with the set differences as the value
-			differences[level] = 'Key Difference: {0} - {1}'.format(s1-s2, s2-s1)
-			# Store shared keys
-			commonKeys = s1 & s2
-		else:
-			commonKeys = set(d1.keys())
-		# Iterate through the shared keys and send back through function
-		for key in commonKeys:
-			differences = deepDiff(d1[key], d2[key], differences, level='{}.{}'.format(level, key))
-		return differences
-	# If current layer is a list, check the lengths
+			yield (tuple(path), DIFF_KEYS, s1 - s2, s2 - s1)
+		pairs = ((key, d1[key], d2[key]) for key in d1 if key in d2)
 	elif isinstance(d1, list) and isinstance(d2, list):
-		# If lengths differ, store the level as a key to differences dict with length difference string as value
 		if len(d1) != len(d2):
-			differences[level] = 'List Length Difference: len({0}1) = {1} while len({2}2) = {3}'.format(level, len(d1), level, len(d2))
-		# Store common length as integer
-		commonLength = min(len(d1), len(d2))
-		# Iterate through length and pass each list item back through function
-		for i in range(commonLength):
-			differences = deepDiff(d1[i], d2[i], differences, level='{0}[{1}]'.format(level, i))
-		return differences
-	# If current layer is not a list or dictionary, check the values
+			yield (tuple(path), DIFF_LENGTH, len(d1), len(d2))
+		pairs = ((i, d1[i], d2[i]) for i in range(min(len(d1), len(d2))))
 	else:
 		if d1 != d2:
-			differences[level] = 'Value Difference: {0} != {1}'.format(d1, d2)
-		return differences
+			yield (tuple(path), DIFF_VALUE, d1, d2)
+		return
+	for key, v1, v2 in pairs:
+		# Leaves are compared here rather than in another generator.
+		if isinstance(v1, (dict, list)) or isinstance(v2, (dict, list)):
+			path.append(key)
+			for record in iterDiff(v1, v2, path):
+				yield record
+			path.pop()
+		elif v1 != v2:
+			yield (tuple(path) + (key,), DIFF_VALUE, v1, v2)
+			
+def renderDiffPath(path, root='root'):
+	""" Render a difference path as deepDiff() levels, ie root.columns[0].name """
+	return root + ''.join('[{0}]'.format(key) if isinstance(key, (int, long)) else '.{0}'.format(key)
+						  for key in path)
+	
+def renderDiffRecord(record, root='root'):
+	""" Render a difference record as the (level, message) of deepDiff(). """
+	path, kind, old, new = record
+	level = renderDiffPath(path, root)
+	if kind == DIFF_KEYS:
+		return level, 'Key Difference: {0} - {1}'.format(old, new)
+	if kind == DIFF_LENGTH:
+		return level, 'List Length Difference: len({0}1) = {1} while len({2}2) = {3}'.format(level, old, level, new)
+	return level, 'Value Difference: {0} != {1}'.format(old, new)
+
+def deepDiff(d1, d2, differences=None, level='root'):
+	""" Compare two dictionaries and their contents, rendering every difference. """
+	# Initializing differences dictionary for first level of recursion.
+	differences = differences if differences else {}
+	for record in iterDiff(d1, d2):
+		key, message = renderDiffRecord(record, level)
+		differences[key] = message
+	return differences
+	
+def benchmarkDiff(nodeCount=10000):
+	""" Time the comparison modes on config trees of about nodeCount nodes. """
+	# Intended to be run from the gateway script console.
+	def getTree():
+		return {'columns': [{'name': 'b.[Column{0}]'.format(i),
+							 'characterMax': 50,
+							 'dataType': 'varchar',
+							 'alias': 'Column{0}'.format(i),
+							 'filter_': '',
+							 'orderBy': '',
+							 'referenceTable': 'dbo.Benchmark',
+							 'isDisplayed': 1}
+							for i in range(nodeCount/9)],
+				'pager': {'rowsPerPage': 50, 'currentPage': 1}}
+	def timeIt(function, *args):
+		start = time.time()
+		function(*args)
+		return time.time() - start
+	tree = getTree()
+	lastDiffers = getTree()
+	lastDiffers['columns'][-1]['isDisplayed'] = 0
+	firstDiffers = getTree()
+	firstDiffers['columns'][0]['isDisplayed'] = 0
+	allDiffer = getTree()
+	for col in allDiffer['columns']:
+		col['characterMax'] = 20
+	return {'nodes': nodeCount,
+			'isEqualSameSeconds': timeIt(isEqual, tree, getTree()),
+			'isEqualFirstDiffersSeconds': timeIt(isEqual, tree, firstDiffers),
+			'isEqualLastDiffersSeconds': timeIt(isEqual, tree, lastDiffers),
+			'getDiffLimit10Seconds': timeIt(getDiff, tree, allDiffer, 10),
+			'getDiffFullSeconds': timeIt(getDiff, tree, allDiffer),
+			'deepDiffFullSeconds': timeIt(deepDiff, tree, allDiffer)}
+		
+def getStructuralHash(obj, exclude=None):
+	""" 
+	| Hash of the canonical structure of nested dictionaries and lists
+	| (key order doesn't matter, 1 == 1.0 == True like deepDiff()).
+	| Parameters: obj, exclude key paths ie [('pager', 'currentPage')] (list)
+	| Returns: hex digest (string)
+	"""
+	md5 = hashlib.md5()
+	exclude = set(tuple(path) for path in exclude) if exclude else set()
+	_updateStructuralHash(md5, obj, (), exclude)
+	return md5.hexdigest()
+	
+def _updateStructuralHash(md5, obj, path, exclude):
+	# List items share the path of their list so exclusions apply to every item.
+	if isinstance(obj, dict):
+		md5.update('{')
+		for key in sorted(obj.keys()):
+			if path + (key,) in exclude:
+				continue
+			md5.update(_getCanonicalValue(key))
+			_updateStructuralHash(md5, obj[key], path + (key,), exclude)
+		md5.update('}')
+	elif isinstance(obj, (list, tuple)):
+		md5.update('[')
+		for item in obj:
+			_updateStructuralHash(md5, item, path, exclude)
+		md5.update(']')
+	else:
+		md5.update(_getCanonicalValue(obj))
+		
+def _getCanonicalValue(value):
+	# Type tagged and length prefixed so values can't run into each other.
+	if value is None:
+		return 'z;'
+	if isinstance(value, (bool, int, long)) or (isinstance(value, float) and value.is_integer()):
+		return 'n{0};'.format(int(value))
+	if isinstance(value, float):
+		return 'n{0!r};'.format(value)
+	text = unicode(value).encode('utf-8')
+	return 's{0}:{1}'.format(len(text), text)
 		
 def getReadableDiff(diff):
-	""" Return a readable string from a deepDiff() dictionary. """
+	""" 
+	| Return readable messages for difference records from iterDiff() or
+	| getDiff(). A deepDiff() dictionary is still accepted (legacy).
+	| Parameters: diff (list/iterator of records or dict)
+	| Returns: messages (list)
+	"""
+	if isinstance(diff, dict):
+		return _getLegacyReadableDiff(diff)
+	return list(iterReadableDiff(diff))
+	
+def iterReadableDiff(records):
+	""" 
+	| Lazily yield a readable message per difference record so very large 
+	| change sets can be streamed, ie iterReadableDiff(iterDiff(old, new)).
+	"""
+	for path, kind, old, new in records:
+		# Label is the last level of the path, ie 'columns[0]' or 'name'
+		label = renderDiffPath(path).split('.')[-1]
+		if kind == DIFF_KEYS:
+			removed = sorted(old)
+			added = sorted(new)
+			for initialKey, newKey in zip(removed, added):
+				yield 'Change {0} to {1} at {2}.'.format(initialKey, newKey, label)
+			for key in removed[len(added):]:
+				yield 'Remove {0} from {1}.'.format(key, label)
+			for key in added[len(removed):]:
+				yield 'Add {0} to {1}.'.format(key, label)
+		elif kind == DIFF_LENGTH:
+			difference = new - old
+			if difference > 0:
+				yield 'Add {0} to {1}.'.format(abs(difference), label)
+			else:
+				yield 'Remove {0} from {1}.'.format(abs(difference), label)
+		else:
+			yield 'Change {0} from {1} to {2}.'.format(label, old, new)
+	
+def _getLegacyReadableDiff(diff):
+	# Recovers keys and values by parsing the deepDiff() strings, breaks on
+	# values containing the message separators. Prefer passing records.
 	messages = []
 	for key, val in diff.items():
 		if 'Key Difference' in val: